@@ -1,10 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
 import click
-import json
 
-from datetime import datetime
-from flask import Flask, current_app, request
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask.cli import with_appcontext
 from config import load_config
@@ -50,7 +48,10 @@ def setup_logging(app):
             mongo_handler = MongoDBHandler(
                 app.config['MONGODB_URI'],
                 app.config['MONGODB_DB_NAME'],
-                app.config['MONGODB_LOG_COLLECTION']
+                app.config['MONGODB_LOG_COLLECTION'],
+                buffer_size=int(app.config.get('MONGODB_LOG_BUFFER_SIZE', 10000)),
+                batch_size=int(app.config.get('MONGODB_LOG_BATCH_SIZE', 500)),
+                flush_interval=float(app.config.get('MONGODB_LOG_FLUSH_INTERVAL', 1))
             )
             mongo_handler.setLevel(log_level)
             mongo_formatter = logging.Formatter(
@@ -120,31 +121,19 @@ def create_app(config=None):
     from extensions.redis_sync import init_redis_sync
     init_redis_sync(app)  # 不再需要传递db实例  # 传递应用实例给 Redis 同步模块
 
-    # 添加请求日志中间件
-    @app.before_request
-    def log_request_info():
-        app.logger.info(
-            f"请求: {request.method} {request.path}",
-            extra={
-                'ip': request.remote_addr,
-                'user_agent': request.user_agent.string,
-                'user_id': getattr(request, 'user_id', 'anonymous'),
-                'request_id': request.headers.get('X-Request-ID', 'none')
-            }
-        )
+    # 访问日志（每个请求一条，2xx采样）
+    from .utils.access_log import init_access_log
+    init_access_log(app)
 
-    @app.after_request
-    def log_response_info(response):
-        app.logger.info(
-            f"响应: {response.status_code}",
-            extra={
-                'ip': request.remote_addr,
-                'status_code': response.status_code,
-                'user_id': getattr(request, 'user_id', 'anonymous'),
-                'request_id': request.headers.get('X-Request-ID', 'none')
-            }
-        )
-        return response
+    # SQL性能分析（仅开发/预发环境开启）
+    if app.config.get('QUERY_PROFILER_ENABLED', False):
+        from .utils.query_profiler import init_query_profiler
+        init_query_profiler(app)
+
+    # Prometheus 指标（/metrics）
+    if app.config.get('METRICS_ENABLED', True):
+        from .utils.metrics import init_metrics
+        init_metrics(app)
 
     # 创建超级管理员（如果不存在）
     @app.cli.command("create-admin")
@@ -177,6 +166,45 @@ def create_app(config=None):
         db.session.commit()
         app.logger.info(f"管理员 {admin_username} 创建成功")
 
+    # 根据数据库重建骑手派单索引（Redis数据丢失后执行）
+    @app.cli.command("sync-rider-geo")
+    @with_appcontext
+    def sync_rider_geo():
+        """同步骑手可接单状态和配送半径到Redis"""
+        from app.models.riders.rider import Rider
+        from app.utils.rider_geo import rebuild_rider_dispatch_state
+
+        riders = Rider.query.filter_by(deleted=False).all()
+        count = rebuild_rider_dispatch_state(riders)
+        app.logger.info(f"骑手派单索引已同步，共 {count} 名骑手")
+
+    @app.cli.command("explain-check")
+    @with_appcontext
+    def explain_check():
+        """检查热点查询的执行计划，存在全表扫描时以非零状态退出"""
+        from app.utils.query_plan import check_hot_queries
+
+        failures = check_hot_queries()
+        for name, table, plan in failures:
+            click.echo(f"FULL SCAN  {name} ({table}): {plan}", err=True)
+        if failures:
+            raise SystemExit(1)
+        click.echo("所有热点查询均使用索引")
+
+    @app.cli.command("rollup-statistics")
+    @click.option("--start", "start_date", default=None, help="起始日期 YYYY-MM-DD，默认昨天")
+    @click.option("--end", "end_date", default=None, help="结束日期 YYYY-MM-DD（含），默认与起始日期相同")
+    @with_appcontext
+    def rollup_statistics(start_date, end_date):
+        """汇总或回填餐馆每日统计"""
+        from datetime import date
+        from app.utils.restaurant_statistics import rollup_date_range
+
+        start = date.fromisoformat(start_date) if start_date else date.today() - timedelta(days=1)
+        end = date.fromisoformat(end_date) if end_date else start
+        for day, rows in rollup_date_range(start, end).items():
+            click.echo(f"{day}: {rows} 行")
+
     # 创建websocket通道
     # 添加自定义 CLI 命令
     @app.cli.command("run-with-websocket")
@@ -189,6 +217,7 @@ def create_app(config=None):
         try:
             from flask_socketio import SocketIO, Namespace
             from extensions.redis_sync import get_redis_client
+            from app.utils.rider_location import record_rider_location
 
             # 初始化 SocketIO
             # global socketio
@@ -229,23 +258,22 @@ def create_app(config=None):
                             self.emit('error', {'message': 'Missing required fields: rider_id, latitude, longitude'})
                             return
 
-                        # 准备位置数据
-                        location_data = {
-                            'rider_id': rider_id,
-                            'latitude': latitude,
-                            'longitude': longitude,
-                            'accuracy': data.get('accuracy'),
-                            'speed': data.get('speed'),
-                            'timestamp': datetime.now().isoformat()
-                        }
-
-                        # 以骑手ID为key存储到Redis
-                        rider_key = f"rider:{rider_id}"
-                        new_len = redis_client.rpush(rider_key, json.dumps(location_data))
-                        app.logger.info(f"Location appended for rider {rider_id}, total records: {new_len}")
+                        # 写入骑手轨迹、最新位置和派单索引（单次pipeline），原地或过密的定位会被合并
+                        stored = record_rider_location(
+                            rider_id,
+                            latitude,
+                            longitude,
+                            accuracy=data.get('accuracy'),
+                            speed=data.get('speed'),
+                            order_id=data.get('order_id')
+                        )
 
                         app.logger.info(f"Location updated for rider {rider_id}")
-                        self.emit('location_updated', {'success': True, 'rider_id': rider_id})
+                        self.emit('location_updated', {
+                            'success': True,
+                            'rider_id': rider_id,
+                            'stored': stored is not None
+                        })
                         # self.emit('message', {'data': '您有新的订单啦'})
 
                     except Exception as e:
@@ -12,6 +12,9 @@ from app.models import BaseModel
 class Coupon(BaseModel):
     """优惠券"""
     __tablename__ = 'coupons'
+    __table_args__ = (
+        db.Index('ix_coupons_deleted_created', 'deleted', 'created_at', 'id'),
+    )
 
     # 优惠券类型
     TYPE_PERCENTAGE = 'percentage'  # 百分比折扣
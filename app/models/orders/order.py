@@ -16,6 +16,12 @@ from extensions.sqlalchemy_plus.sqlalchemy import make_uuid
 class Order(BaseModel):
     """订单模型"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_user_deleted_created', 'user_id', 'deleted', 'created_at', 'id'),
+        db.Index('ix_orders_deleted_created', 'deleted', 'created_at', 'id'),
+        db.Index('ix_orders_restaurant_status', 'restaurant_id', 'status'),
+        db.Index('ix_orders_rider_status', 'rider_id', 'status'),
+    )
 
     # 订单状态
     STATUS_PENDING = 'pending'  # 待付款
@@ -27,6 +33,19 @@ class Order(BaseModel):
     STATUS_COMPLETED = 'completed'  # 已完成
     STATUS_CANCELED = 'canceled'  # 已取消
 
+    # 允许的状态流转，由 app.utils.order_state.transition_order 校验
+    TRANSITIONS = {
+        STATUS_PENDING: {STATUS_PAID, STATUS_CANCELED},
+        STATUS_PAID: {STATUS_PREPARING, STATUS_READY, STATUS_CANCELED},
+        STATUS_PREPARING: {STATUS_READY, STATUS_CANCELED},
+        STATUS_READY: {STATUS_DELIVERING, STATUS_CANCELED},
+        STATUS_DELIVERING: {STATUS_COMPLETED},
+        STATUS_COMPLETED: set(),
+        STATUS_CANCELED: set(),
+    }
+    # 可以分配（或重新分配）骑手的订单状态，分配后订单变为 ready
+    ASSIGNABLE_STATUSES = {STATUS_PAID, STATUS_PREPARING, STATUS_READY}
+
     # 订单信息
     uuid = db.Column(db.String(32), default=make_uuid)
     status = db.Column(db.String(20), default=STATUS_PENDING, nullable=False)
@@ -39,6 +58,10 @@ class Order(BaseModel):
     estimated_preparation_time = db.Column(db.Integer)  # 预计准备时间（分钟）
     estimated_delivery_time = db.Column(db.DateTime)  # 预计送达时间
     actual_delivery_time = db.Column(db.DateTime)  # 实际送达时间
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # 乐观锁版本号
+
+    # ORM 对订单的每次更新都带上 WHERE version=? 并递增版本号，并发修改时抛出 StaleDataError
+    __mapper_args__ = {'version_id_col': version}
 
     # 外键
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -4,6 +4,8 @@
 # @Email   : superjustkidding@gmail.com
 # @File    : restaurants.py
 # @Software: PyCharm
+import json
+
 from sqlalchemy import JSON
 
 # ==============================
@@ -300,6 +302,11 @@ class Promotion(BaseModel):
 class RestaurantStatistics(BaseModel):
     """餐馆统计数据"""
     __tablename__ = 'restaurant_statistics'
+    __table_args__ = (
+        # 每个餐馆每天一行，由 tasks.db_tasks.rollup_restaurant_statistics 汇总写入
+        db.UniqueConstraint('restaurant_id', 'date', name='uq_restaurant_statistics_restaurant_date'),
+        db.Index('ix_restaurant_statistics_date', 'date'),
+    )
 
     # 统计信息
     date = db.Column(db.Date, nullable=False)
@@ -319,13 +326,13 @@ class RestaurantStatistics(BaseModel):
     def to_dict(self):
         return {
             "id": self.id,
-            "date": self.date,
+            "date": self.date.isoformat() if self.date else None,
             "total_orders": self.total_orders,
             "completed_orders": self.completed_orders,
             "canceled_orders": self.canceled_orders,
             "total_revenue": self.total_revenue,
             "average_rating": self.average_rating,
-            "popular_items": self.popular_items,
+            "popular_items": json.loads(self.popular_items) if self.popular_items else [],
         }
 
 
@@ -17,6 +17,10 @@ from flask_login import UserMixin
 class Rider(BaseModel, UserMixin):
     """骑手模型"""
     __tablename__ = 'riders'
+    __table_args__ = (
+        db.Index('ix_riders_online_available_deleted', 'is_online', 'is_available', 'deleted'),
+        db.Index('ix_riders_deleted_created', 'deleted', 'created_at', 'id'),
+    )
 
     # 基本信息
     name = db.Column(db.String(50), nullable=False)
@@ -76,6 +80,9 @@ class Rider(BaseModel, UserMixin):
 class RiderLocation(BaseModel):
     """骑手实时位置"""
     __tablename__ = 'rider_locations'
+    __table_args__ = (
+        db.Index('ix_rider_locations_rider_timestamp', 'rider_id', 'timestamp'),
+    )
 
     # 位置信息
     latitude = db.Column(db.Float, nullable=False)
@@ -86,7 +93,7 @@ class RiderLocation(BaseModel):
 
     # 外键
     rider_id = db.Column(db.Integer, db.ForeignKey('riders.id'), nullable=False)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))  # 空闲时的定位没有订单
 
     def __repr__(self):
         return f'<RiderLocation ({self.latitude}, {self.longitude})>'
@@ -99,12 +106,16 @@ class RiderLocation(BaseModel):
             'longitude': self.longitude,
             'accuracy': self.accuracy,
             'speed': self.speed,
+            'order_id': self.order_id,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
         }
 
 class RiderAssignment(BaseModel):
     """骑手订单分配"""
     __tablename__ = 'rider_assignments'
+    __table_args__ = (
+        db.Index('ix_rider_assignments_rider_status', 'rider_id', 'status'),
+    )
 
     # 分配状态
     STATUS_PENDING = 'pending'  # 待接受
@@ -16,6 +16,9 @@ from flask_login import UserMixin
 class User(BaseModel, UserMixin):
     """用户模型（顾客）"""
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_created', 'created_at', 'id'),
+    )
 
     # 基本信息
     username = db.Column(db.String(50), unique=True, nullable=False)
@@ -89,6 +92,11 @@ class UserAddress(BaseModel):
 class UserCoupon(BaseModel):
     """用户拥有的优惠券"""
     __tablename__ = 'user_coupons'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'coupon_id', name='uq_user_coupons_user_coupon'),
+        db.Index('ix_user_coupons_user_coupon_status', 'user_id', 'coupon_id', 'status'),
+        db.Index('ix_user_coupons_status_coupon', 'status', 'coupon_id'),
+    )
 
     # 状态
     STATUS_UNUSED = 'unused'
@@ -1,8 +1,17 @@
 # -*- coding: utf-8 -*-
+import uuid
+
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models import Coupon, UserCoupon, User
+from app.utils.coupon_distribution import (
+    get_distribution_progress, mark_distribution_failed, mark_distribution_queued, progress_key
+)
 from app.routes.logger import logger
+from app.utils.pagination import cursor_paginate
+from app.utils.task_queue import send_task
 from app.utils.validation import BusinessValidationError
+from extensions.redis_sync import get_redis_client
 from lib.ecode import ECode
 
 
@@ -31,14 +40,13 @@ class CouponEntity:
         logger.info('Coupon created: %s', coupon.id)
         return coupon.to_dict(), ECode.SUCC
 
-    def get_all_coupons(self, **filters):
+    def get_all_coupons(self, cursor=None, per_page=20, with_total=False, **filters):
         if not self.current_user.is_admin:
             raise BusinessValidationError("Permission denied", ECode.FORBID)
         query = Coupon.query.filter_by(deleted=False)
         if 'coupon_type' in filters:
             query = query.filter(Coupon.coupon_type.ilike(f"%{filters['coupon_type']}%"))
-        coupons = query.all()
-        return [c.to_dict() for c in coupons], ECode.SUCC
+        return cursor_paginate(query, Coupon, cursor, per_page, with_total), ECode.SUCC
 
 
 class CouponAssignEntity:
@@ -60,36 +68,43 @@ class CouponAssignEntity:
 
         user_coupon = UserCoupon(user_id=user_id, coupon_id=self.coupon_id)
         db.session.add(user_coupon)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # 并发发放时由 (user_id, coupon_id) 唯一约束兜底
+            db.session.rollback()
+            raise BusinessValidationError("Coupon already assigned", ECode.CONFLICT)
         return user_coupon.to_dict(), ECode.SUCC
 
-    def auto_assign_coupon(self):
-        """自动发放优惠券给所有用户"""
-        users = User.query.all()
-        if not users:
+    def auto_assign_coupon(self, restart=False):
+        """自动发放优惠券给所有用户（投递到 Celery 异步分块发放，通过进度接口查询结果）"""
+        if not User.query.filter_by(deleted=False).first():
             raise BusinessValidationError("No users found", ECode.CONFLICT)
 
-        assigned, skipped = [], []
-
-        for user in users:
-            if UserCoupon.query.filter_by(user_id=user.id, coupon_id=self.coupon_id).first():
-                skipped.append(user.id)
-                continue
-
-            uc = UserCoupon(user_id=user.id, coupon_id=self.coupon_id)
-            db.session.add(uc)
-            assigned.append(user.id)
-
-        db.session.commit()
+        task_id = str(uuid.uuid4())
+        redis_client = get_redis_client()
+        # 先记录排队状态再投递，避免 worker 写入的 running 状态被覆盖；已有发放进行中时返回 409
+        mark_distribution_queued(redis_client, self.coupon_id, task_id=task_id, restart=restart)
+        try:
+            send_task('tasks.db_tasks.distribute_coupon', args=[self.coupon_id, restart], task_id=task_id)
+        except Exception:
+            mark_distribution_failed(redis_client, self.coupon_id)
+            raise
 
-        logger.info("Coupon %s auto-assigned. Success: %s, Skipped: %s",
-                    self.coupon_id, assigned, skipped)
+        logger.info("Coupon %s auto-assign queued, task_id: %s", self.coupon_id, task_id)
 
         return {
                 "coupon": self.coupon.to_dict(),
-                "assigned_users": assigned,
-                "skipped_users": skipped
-            }, ECode.SUCC
+                "task_id": task_id,
+                "progress_key": progress_key(self.coupon_id)
+            }, ECode.ACCEPTED
+
+    def get_auto_assign_progress(self):
+        """查询自动发放进度"""
+        progress = get_distribution_progress(get_redis_client(), self.coupon_id)
+        if not progress:
+            raise BusinessValidationError("No distribution progress", ECode.NOTFOUND)
+        return progress, ECode.SUCC
 
 class CouponListEntity:
     def __init__(self, coupon_id):
@@ -5,6 +5,7 @@ from flask_restful import Resource
 from app.routes.coupons.entities import CouponEntity, CouponAssignEntity, CouponListEntity
 from app.routes.jwt import admin_required, current_user
 from app.schemas.coupon.coupon_schema import CouponSchema, CouponUpdateSchema
+from app.utils.pagination import pagination_args
 from app.utils.validation import validate_request
 
 
@@ -20,7 +21,10 @@ class CouponResource(Resource):
     @admin_required
     def get(self):
         entity = CouponEntity(current_user=current_user)
-        return entity.get_all_coupons()
+        filters = {}
+        if request.args.get('coupon_type'):
+            filters['coupon_type'] = request.args.get('coupon_type')
+        return entity.get_all_coupons(**pagination_args(request.args), **filters)
 
 class CouponAssignResource(Resource):
     endpoint = 'api.CouponAssignResource'
@@ -32,9 +36,15 @@ class CouponAssignResource(Resource):
         if 'user_id' in data:
             return entity.assign_user_single(data['user_id'])
         elif data.get('auto'):
-            return entity.auto_assign_coupon()
+            return entity.auto_assign_coupon(restart=bool(data.get('restart')))
         return None
 
+    @admin_required
+    def get(self, coupon_id):
+        """查询自动发放进度"""
+        entity = CouponAssignEntity(coupon_id=coupon_id)
+        return entity.get_auto_assign_progress()
+
 class CouponListResource(Resource):
     endpoint = 'api.CouponListResource'
 
@@ -9,17 +9,18 @@
 # 创建身份验证工具函数
 
 from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required, get_jwt
-from flask import jsonify, current_app
+from flask import jsonify, current_app, g
 from datetime import timedelta
 from functools import wraps
 import json
 from werkzeug.local import LocalProxy
 
 # 从应用包中导入 jwt 实例和模型
-from app import jwt
+from app import jwt, db
 from app.models.users.user import User
 from app.models.restaurants.restaurant import Restaurant
 from app.models.riders.rider import Rider
+from app.utils.identity_cache import get_cached_claims, cache_claims
 
 
 def create_auth_token(identity_obj):
@@ -62,35 +63,115 @@ def create_auth_token(identity_obj):
 
 
 def get_current_identity():
-    """获取当前身份信息"""
+    """获取当前身份信息（同一请求内只解析一次）"""
+    if '_jwt_identity' in g:
+        return g._jwt_identity
+
     identity_str = get_jwt_identity()
     try:
         # 将字符串解析回字典
-        return json.loads(identity_str)
+        identity = json.loads(identity_str)
     except (json.JSONDecodeError, TypeError):
         # 如果无法解析，返回原始字符串
-        return {'id': identity_str, 'type': 'unknown', 'is_admin': False}
+        identity = {'id': identity_str, 'type': 'unknown', 'is_admin': False}
+    g._jwt_identity = identity
+    return identity
+
+
+# 身份类型 -> (模型, 缓存分类)，管理员也是 User
+_IDENTITY_MODELS = {
+    'user': (User, 'user'),
+    'admin': (User, 'user'),
+    'restaurant': (Restaurant, 'restaurant'),
+    'rider': (Rider, 'rider'),
+}
+
+
+def load_identity_claims(identity_type, identity_id):
+    """
+    获取身份的轻量声明 {'id', 'is_admin'}
+
+    优先读取缓存，未命中时只查询 id / is_admin 两列；身份不存在返回None。
+    is_admin 以数据库为准，令牌签发后被取消管理员权限的账号在缓存过期后即失效。
+    """
+    model, kind = _IDENTITY_MODELS[identity_type]
+    claims = get_cached_claims(kind, identity_id)
+    if claims is not None:
+        return claims
+
+    is_admin_column = model.is_admin if hasattr(model, 'is_admin') else db.false()
+    row = db.session.query(model.id, is_admin_column).filter(model.id == identity_id).first()
+    if row is None:
+        return None
+
+    claims = {'id': row[0], 'is_admin': bool(row[1])}
+    cache_claims(kind, claims)
+    return claims
+
+
+class CurrentIdentity:
+    """
+    当前请求的身份
+
+    id / is_admin / identity_type 直接来自声明缓存，鉴权判断不访问数据库；
+    访问其他属性时才加载完整的 User / Restaurant / Rider 对象（每个请求最多一次）。
+    """
+    __slots__ = ('id', 'is_admin', 'identity_type', '_model', '_obj')
+
+    def __init__(self, identity_type, claims):
+        object.__setattr__(self, 'id', claims['id'])
+        object.__setattr__(self, 'is_admin', claims['is_admin'])
+        object.__setattr__(self, 'identity_type', identity_type)
+        object.__setattr__(self, '_model', _IDENTITY_MODELS[identity_type][0])
+        object.__setattr__(self, '_obj', None)
+
+    def _load(self):
+        obj = object.__getattribute__(self, '_obj')
+        if obj is None:
+            model = object.__getattribute__(self, '_model')
+            obj = db.session.get(model, object.__getattribute__(self, 'id'))
+            object.__setattr__(self, '_obj', obj)
+        return obj
+
+    @property
+    def __class__(self):
+        # 保持 current_user.__class__.__name__ 等用法返回模型类
+        return object.__getattribute__(self, '_model')
+
+    def __getattr__(self, name):
+        obj = self._load()
+        if obj is None:
+            raise AttributeError(name)
+        return getattr(obj, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        return f"<CurrentIdentity {object.__getattribute__(self, 'identity_type')}:{object.__getattribute__(self, 'id')}>"
 
 
 def get_current_user():
-    """获取当前用户对象"""
+    """获取当前用户对象（结果缓存在 flask.g 上，同一请求内只解析一次）"""
+    if '_current_user' in g:
+        return g._current_user
+
+    user = None
     try:
         # 获取身份信息
         identity = get_current_identity()
         identity_type = identity.get('type')
         identity_id = identity.get('id')
 
-        # 根据类型加载不同的对象
-        if identity_type == 'user' or identity_type == 'admin':
-            return User.query.get(identity_id)
-        elif identity_type == 'restaurant':
-            return Restaurant.query.get(identity_id)
-        elif identity_type == 'rider':
-            return Rider.query.get(identity_id)
+        if identity_type in _IDENTITY_MODELS:
+            claims = load_identity_claims(identity_type, identity_id)
+            if claims is not None:
+                user = CurrentIdentity(identity_type, claims)
     except Exception as e:
         current_app.logger.error(f"Error getting current user: {e}")
 
-    return None
+    g._current_user = user
+    return user
 
 
 # 创建 LocalProxy
@@ -5,7 +5,10 @@ from app import db
 from app.routes.logger import logger
 from lib.ecode import ECode
 
-from app.utils.geo import haversine
+from app.utils.order_state import transition_order
+from app.utils.pagination import cursor_paginate
+from app.utils.restaurant_sales import record_completed_order
+from app.utils.rider_geo import search_available_riders
 from app.utils.validation import BusinessValidationError
 from extensions.redis_sync import get_redis_client
 from app.models import Order, OrderItem, OrderItemOption, OrderStatusHistory, RiderAssignment, Rider, Review, ItemReview
@@ -41,24 +44,8 @@ class OrderEntity:
         db.session.add(order)
         db.session.flush()  # 获取订单ID但不提交
 
-        # 添加订单项
-        for item_data in data.get('items', []):
-            item = OrderItem(
-                order_id=order.id,
-                menu_item_id=item_data['menu_item_id'],
-                quantity=item_data['quantity'],
-                price_at_order=item_data['price_at_order'],
-                special_instructions=item_data.get('special_instructions')
-            )
-            db.session.add(item)
-
-            # 处理选项
-            for option_data in item_data.get('options', []):
-                option = OrderItemOption(
-                    order_item_id=item.id,
-                    option_id=option_data['option_id']
-                )
-                db.session.add(option)
+        # 批量添加订单项和选项
+        self._insert_order_items(order.id, data.get('items', []))
 
         # 添加初始状态历史
         status_history = OrderStatusHistory(
@@ -78,8 +65,41 @@ class OrderEntity:
 
         return order.to_dict(), ECode.SUCC
 
-    def get_orders(self, **filters):
-        """获取订单列表"""
+    @staticmethod
+    def _insert_order_items(order_id, items_data):
+        """
+        批量写入订单项及其选项，数据库往返次数与购物车大小无关
+
+        订单项整批INSERT后按ID回查：同一次批量INSERT生成的自增ID按行顺序递增，
+        新订单下只有这一批订单项，回查结果与 items_data 一一对应。
+        MySQL 不支持 executemany + RETURNING，因此不依赖 RETURNING 取回ID。
+        """
+        if not items_data:
+            return
+
+        item_rows = [{
+            'order_id': order_id,
+            'menu_item_id': item_data['menu_item_id'],
+            'quantity': item_data['quantity'],
+            'price_at_order': item_data['price_at_order'],
+            'special_instructions': item_data.get('special_instructions'),
+        } for item_data in items_data]
+
+        db.session.execute(db.insert(OrderItem), item_rows)
+        item_ids = db.session.scalars(
+            db.select(OrderItem.id).where(OrderItem.order_id == order_id).order_by(OrderItem.id)
+        ).all()
+
+        option_rows = [
+            {'order_item_id': item_id, 'option_id': option_data['option_id']}
+            for item_id, item_data in zip(item_ids, items_data)
+            for option_data in item_data.get('options', [])
+        ]
+        if option_rows:
+            db.session.execute(db.insert(OrderItemOption), option_rows)
+
+    def get_orders(self, cursor=None, per_page=20, with_total=False, **filters):
+        """获取订单列表（游标分页）"""
         query = Order.query.filter_by(deleted=False)
 
         # 权限检查：用户只能查看自己的订单
@@ -99,11 +119,8 @@ class OrderEntity:
         if 'end_date' in filters:
             query = query.filter(Order.created_at <= filters['end_date'])
 
-        # 排序
-        query = query.order_by(Order.created_at.desc())
-
-        orders = query.all()
-        return [order.to_dict() for order in orders], ECode.SUCC
+        # 按 (created_at, id) 倒序游标分页
+        return cursor_paginate(query, Order, cursor, per_page, with_total), ECode.SUCC
 
     def get_order(self, order_id):
         """获取单个订单详情"""
@@ -119,32 +136,23 @@ class OrderEntity:
         return order.to_dict(), ECode.SUCC
 
     def update_order_status(self, order_id, new_status, note=None):
-        """更新订单状态"""
-        order = Order.query.filter_by(id=order_id, deleted=False).first()
-        if not order:
-            raise BusinessValidationError("Order not found", ECode.NOTFOUND)
-
-        # 权限检查：用户只能取消自己的订单，餐厅和管理员可以更新状态
-        if (new_status == Order.STATUS_CANCELED and
-                not self.current_user.is_admin and
-                self.current_user.id != order.user_id):
-            raise BusinessValidationError("Permission denied", ECode.FORBID)
-
-        # 更新订单状态
-        order.status = new_status
-
-        # 添加状态历史
-        status_history = OrderStatusHistory(
-            order_id=order.id,
-            status=new_status,
-            actor_id=self.current_user.id,
-            actor_type=self.current_user.__class__.__name__.lower(),
-            note=note or f"Status changed to {new_status}"
+        """更新订单状态（按状态机校验，乐观并发控制）"""
+        def check_permission(order):
+            # 权限检查：用户只能取消自己的订单，餐厅和管理员可以更新状态
+            if (new_status == Order.STATUS_CANCELED and
+                    not self.current_user.is_admin and
+                    self.current_user.id != order.user_id):
+                raise BusinessValidationError("Permission denied", ECode.FORBID)
+
+        order, old_status = transition_order(
+            order_id, new_status, actor=self.current_user, note=note, check=check_permission
         )
-        db.session.add(status_history)
-
         db.session.commit()
 
+        # 订单完成时增量累加餐馆销售额
+        if new_status == Order.STATUS_COMPLETED and old_status != Order.STATUS_COMPLETED:
+            record_completed_order(order)
+
         # 发布状态更新事件
         # 发送状态更新通知
         notify_order_status_update(order_id, new_status, None)
@@ -187,65 +195,28 @@ class OrderEntity:
         return scored_riders[0] if scored_riders else None
 
     def get_nearby_riders(self, lat, lon, radius=5000, limit=5):
-        """获取附近的在线骑手（从Redis查询）"""
-        nearby_riders = []
-
-        # 获取所有在线骑手
-        online_riders = Rider.query.filter_by(
-            is_online=True,
-            is_available=True,
-            deleted=False
-        ).all()
-
-        for rider in online_riders:
-            # 从Redis获取骑手最新位置
-            latest_location = redis_client.zrevrange(f"rider_locations:{rider.id}", 0, 0)
-            if not latest_location:
-                continue
-
-            location_data = json.loads(latest_location[0])
-            rider_lat = location_data.get('latitude')
-            rider_lon = location_data.get('longitude')
-
-            if rider_lat is None or rider_lon is None:
-                continue
-
-            # 计算距离
-            distance = haversine(lat, lon, rider_lat, rider_lon)
-
-            # 检查是否在配送半径内
-            if rider.delivery_radius and distance > rider.delivery_radius:
-                continue
-
-            # 添加到附近骑手列表
-            nearby_riders.append({
-                'rider_id': rider.id,
-                'distance': distance,
-                'location': {
-                    'latitude': rider_lat,
-                    'longitude': rider_lon
-                }
-            })
-
-        # 按距离排序并限制数量
-        nearby_riders.sort(key=lambda x: x['distance'])
-        return nearby_riders[:limit]
+        """获取附近的在线骑手（从Redis GEO索引查询）"""
+        return search_available_riders(lat, lon, radius=radius, limit=limit)
 
     def get_rider_order_loads(self, rider_ids):
-        """获取骑手的当前订单量（正在进行的订单数量）"""
-        loads = {}
-
-        for rider_id in rider_ids:
-            # 查询骑手正在进行的订单数量（状态为accepted且订单状态为preparing, ready或delivering）
-            load_count = db.session.query(RiderAssignment).join(Order).filter(
-                RiderAssignment.rider_id == rider_id,
-                RiderAssignment.status == RiderAssignment.STATUS_ACCEPTED,
-                Order.status.in_([Order.STATUS_PREPARING, Order.STATUS_READY, Order.STATUS_DELIVERING]),
-                Order.deleted == False
-            ).count()
-
-            loads[rider_id] = load_count
-
+        """获取骑手的当前订单量（正在进行的订单数量），一次分组查询返回全部候选骑手"""
+        if not rider_ids:
+            return {}
+
+        # 查询骑手正在进行的订单数量（状态为accepted且订单状态为preparing, ready或delivering）
+        rows = db.session.query(
+            RiderAssignment.rider_id,
+            db.func.count(RiderAssignment.id)
+        ).join(Order).filter(
+            RiderAssignment.rider_id.in_(rider_ids),
+            RiderAssignment.status == RiderAssignment.STATUS_ACCEPTED,
+            Order.status.in_([Order.STATUS_PREPARING, Order.STATUS_READY, Order.STATUS_DELIVERING]),
+            Order.deleted == False
+        ).group_by(RiderAssignment.rider_id).all()
+
+        # 没有进行中订单的骑手负载为0
+        loads = {rider_id: 0 for rider_id in rider_ids}
+        loads.update({rider_id: load_count for rider_id, load_count in rows})
         return loads
 
     def assign_rider(self, order_id, rider_id):
@@ -254,14 +225,19 @@ class OrderEntity:
         if not (self.current_user.is_admin or hasattr(self.current_user, 'restaurant_id')):
             raise BusinessValidationError("Permission denied", ECode.FORBID)
 
-        order = Order.query.filter_by(id=order_id, deleted=False).first()
-        if not order:
-            raise BusinessValidationError("Order not found", ECode.NOTFOUND)
-
         rider = Rider.query.filter_by(id=rider_id, deleted=False, is_online=True).first()
         if not rider:
             raise BusinessValidationError("Rider not available", ECode.NOTFOUND)
 
+        # 更新订单状态并记录状态历史
+        order, _ = transition_order(
+            order_id, Order.STATUS_READY,
+            actor=self.current_user,
+            note=f"Rider {rider.name} assigned",
+            values={'rider_id': rider_id},
+            allowed_from=Order.ASSIGNABLE_STATUSES
+        )
+
         # 创建骑手分配记录
         assignment = RiderAssignment(
             order_id=order_id,
@@ -270,20 +246,6 @@ class OrderEntity:
         )
         db.session.add(assignment)
 
-        # 更新订单状态
-        order.status = Order.STATUS_READY
-        order.rider_id = rider_id
-
-        # 添加状态历史
-        status_history = OrderStatusHistory(
-            order_id=order.id,
-            status=Order.STATUS_READY,
-            actor_id=self.current_user.id,
-            actor_type=self.current_user.__class__.__name__.lower(),
-            note=f"Rider {rider.name} assigned"
-        )
-        db.session.add(status_history)
-
         db.session.commit()
 
         # 通过WebSocket通知骑手
@@ -320,6 +282,15 @@ class OrderEntity:
         if not rider:
             raise BusinessValidationError("Selected rider is no longer available", ECode.NOTFOUND)
 
+        # 更新订单状态并记录状态历史
+        order, _ = transition_order(
+            order_id, Order.STATUS_READY,
+            actor=self.current_user,
+            note=f"Rider {rider.name} automatically assigned (distance: {optimal_rider['distance']:.2f}m, load: {optimal_rider['load']})",
+            values={'rider_id': rider_id},
+            allowed_from=Order.ASSIGNABLE_STATUSES
+        )
+
         # 创建骑手分配记录
         assignment = RiderAssignment(
             order_id=order_id,
@@ -327,20 +298,6 @@ class OrderEntity:
             status=RiderAssignment.STATUS_PENDING
         )
         db.session.add(assignment)
-
-        # 更新订单状态
-        order.status = Order.STATUS_READY
-        order.rider_id = rider_id
-
-        # 添加状态历史
-        status_history = OrderStatusHistory(
-            order_id=order.id,
-            status=Order.STATUS_READY,
-            actor_id=self.current_user.id,
-            actor_type=self.current_user.__class__.__name__.lower(),
-            note=f"Rider {rider.name} automatically assigned (distance: {optimal_rider['distance']:.2f}m, load: {optimal_rider['load']})"
-        )
-        db.session.add(status_history)
         db.session.commit()
 
         # 通过WebSocket通知骑手
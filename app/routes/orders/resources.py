@@ -7,6 +7,7 @@ from app.routes.jwt import admin_required, current_user, user_required, restaura
 from app.routes.orders.entities import OrderEntity, OrderItemEntity, OrderReviewEntity, OrderReviewListEntity
 from app.schemas.orders.orders_schema import OrderSchema, OrderUpdateSchema, OrderAssignmentSchema, ReviewSchema, \
     ReviewRestaurantSchema
+from app.utils.pagination import pagination_args
 from app.utils.validation import validate_request
 
 
@@ -36,7 +37,7 @@ class OrderListResource(Resource):
             except ValueError:
                 pass
 
-        return entity.get_orders(**filters)
+        return entity.get_orders(**pagination_args(request.args), **filters)
 
     @user_required
     def post(self):
@@ -13,19 +13,16 @@ from app.models.payments import Payment
 from app.utils.validation import BusinessValidationError
 from app.routes.logger import logger
 from lib.ecode import ECode
-from app.utils.wechat_utils import WeChatPay
+from app.utils.payment_notify import apply_payment_notifications, enqueue_payment_notify
+from app.utils.wechat_utils import get_wechat_pay
+from extensions.redis_sync import get_redis_client
 
 
 class WeChatPayEntity:
     def __init__(self, current_user=None):
         self.current_user = current_user
-        # 初始化微信支付工具
-        self.wechat_pay = WeChatPay(
-            appid=current_app.config.get('WECHAT_APPID'),
-            mch_id=current_app.config.get('WECHAT_MCH_ID'),
-            api_key=current_app.config.get('WECHAT_API_KEY'),
-            sandbox=current_app.config.get('WECHAT_SANDBOX', True)
-        )
+        # 进程内共享的微信支付客户端（长连接池）
+        self.wechat_pay = get_wechat_pay(current_app.config)
 
     def create_order(self, data):
         """创建微信支付订单"""
@@ -85,7 +82,12 @@ class WeChatPayEntity:
             raise BusinessValidationError(f"创建支付订单失败: {str(e)}", ECode.ERROR)
 
     def handle_notify(self, xml_data):
-        """处理微信支付回调"""
+        """
+        处理微信支付回调
+
+        只做验签、按 out_trade_no/transaction_id 去重和入队，由 tasks.db_tasks.process_payment_notifications
+        批量更新支付和订单状态；Redis不可用时同步处理。
+        """
         try:
             # 解析XML数据
             notify_data = self.wechat_pay.xml_to_dict(xml_data)
@@ -101,29 +103,17 @@ class WeChatPayEntity:
                 logger.error("微信支付回调缺少商户订单号")
                 return {'return_code': 'FAIL', 'return_msg': '参数错误'}
 
-            # 查询支付订单
-            payment_order = Payment.query.filter_by(out_trade_no=out_trade_no).first()
-            if not payment_order:
-                logger.error(f"支付订单不存在: {out_trade_no}")
-                return {'return_code': 'FAIL', 'return_msg': '订单不存在'}
-
-            # 更新订单状态
-            if notify_data.get('return_code') == 'SUCCESS' and notify_data.get('result_code') == 'SUCCESS':
-                payment_order.status = 'SUCCESS'
-                payment_order.transaction_id = notify_data.get('transaction_id')
-                payment_order.time_end = notify_data.get('time_end')
-                payment_order.bank_type = notify_data.get('bank_type')
-                payment_order.cash_fee = notify_data.get('cash_fee')
-
-                # 这里可以添加业务逻辑，例如更新订单状态、发放商品等
-                logger.info(f"支付成功: {out_trade_no}, 金额: {notify_data.get('total_fee')}")
-            else:
-                payment_order.status = 'FAIL'
-                payment_order.err_code = notify_data.get('err_code')
-                payment_order.err_code_des = notify_data.get('err_code_des')
-                logger.error(f"支付失败: {out_trade_no}, 错误: {notify_data.get('err_code_des')}")
-
-            db.session.commit()
+            redis_client = get_redis_client()
+            if redis_client is None:
+                logger.warning(f"Redis客户端未初始化，同步处理支付回调: {out_trade_no}")
+                _, rejected = apply_payment_notifications([notify_data])
+                db.session.commit()
+                if rejected:
+                    # 无法留存到死信，应答失败让微信重试通知
+                    return_msg = '订单不存在' if rejected[0][1].startswith('missing') else '金额不一致'
+                    return {'return_code': 'FAIL', 'return_msg': return_msg}
+            elif not enqueue_payment_notify(redis_client, notify_data):
+                logger.info(f"重复的支付回调: {out_trade_no}")
 
             return {'return_code': 'SUCCESS', 'return_msg': 'OK'}
 
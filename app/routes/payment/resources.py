@@ -6,7 +6,7 @@
 # @Software: PyCharm
 
 from flask_restful import Resource
-from flask import request, current_app
+from flask import request
 from .entities import WeChatPayEntity
 from app.schemas.payment.payment_schema import WeChatPayCreateOrderSchema
 from app.utils.validation import validate_request
@@ -38,14 +38,7 @@ class WeChatPayNotifyResource(Resource):
         result = entity.handle_notify(xml_data)
 
         # 返回XML格式的响应
-        from app.utils.wechat_utils import WeChatPay
-        wechat_pay = WeChatPay(
-            appid=current_app.config.get('WECHAT_APPID'),
-            mch_id=current_app.config.get('WECHAT_MCH_ID'),
-            api_key=current_app.config.get('WECHAT_API_KEY'),
-            sandbox=current_app.config.get('WECHAT_SANDBOX', True)
-        )
-        return wechat_pay.dict_to_xml(result), 200, {'Content-Type': 'application/xml'}
+        return entity.wechat_pay.dict_to_xml(result), 200, {'Content-Type': 'application/xml'}
 
 
 class WeChatPayQueryResource(Resource):
@@ -9,7 +9,8 @@ from .resources import RestaurantListResource, RestaurantResource, RestaurantLog
     MenuCategoryResource, MenuItemResource, MenuItemListResource, MenuCategoryListResource, MenuOptionGroupListResource, \
     MenuOptionGroupResource, MenuOptionListResource, MenuOptionResource, DeliveryZoneListResource, DeliveryZoneResource, \
     OperatingHoursListResource, OperatingHoursResource, PromotionListResource, PromotionResource, \
-    DeliveryPolygonListResource, DeliveryPolygonResource, RestaurantStatisticsResource, RestaurantStatisticsListResource
+    DeliveryPolygonListResource, DeliveryPolygonResource, RestaurantStatisticsResource, RestaurantStatisticsListResource, \
+    DeliveryZoneLookupResource, RestaurantMenuResource
 
 
 def register_restaurant_routes(api):
@@ -18,6 +19,7 @@ def register_restaurant_routes(api):
     api.add_resource(RestaurantResource, '/restaurants/<int:restaurant_id>')  # 餐馆详情
     api.add_resource(RestaurantLoginResource, '/restaurants/login')  # 餐馆登录
     api.add_resource(MenuItemListResource, '/restaurants/<int:restaurant_id>/menu')  # 菜品
+    api.add_resource(RestaurantMenuResource, '/restaurants/<int:restaurant_id>/menu/full')  # 完整菜单树
     api.add_resource(MenuItemResource, '/menuitem/<int:menuitem_id>')  # 菜品详情
     api.add_resource(MenuCategoryListResource, '/restaurants/<int:restaurant_id>/menu_category')  # 菜品分类
     api.add_resource(MenuCategoryResource, '/categories/<int:menu_category_id>')  # 菜品分类详情
@@ -29,6 +31,7 @@ def register_restaurant_routes(api):
     api.add_resource(DeliveryZoneResource, '/delivery_zone/<int:delivery_zone_id>')  # 配送区域详情
     api.add_resource(DeliveryPolygonListResource,'/zones/<int:zone_id>/polygons')  # 配送区域多边形
     api.add_resource(DeliveryPolygonResource, "/polygons/<int:polygon_id>")  # 配送区域多边形详情
+    api.add_resource(DeliveryZoneLookupResource, "/delivery_zones/lookup")  # 按坐标查询可配送区域
     api.add_resource(OperatingHoursListResource, '/restaurants/<int:restaurant_id>/operating_hours')  # 营业时间
     api.add_resource(OperatingHoursResource, '/operating_hours/<int:operating_hours_id>')  # 营业时间详情
     api.add_resource(PromotionListResource, '/restaurants/<int:restaurant_id>/promotion')  # 促销活动
@@ -43,6 +46,7 @@ def register_restaurant_routes(api):
         'api.RestaurantLoginResource',
         'api.MenuItemResource',
         'api.MenuItemListResource',
+        'api.RestaurantMenuResource',
         'api.MenuCategoryListResource',
         'api.MenuCategoryResource',
         'api.MenuOptionGroupListResource',
@@ -51,6 +55,7 @@ def register_restaurant_routes(api):
         'api.DeliveryZoneResource',
         'api.DeliveryPolygonListResource',
         'api.DeliveryPolygonResource',
+        'api.DeliveryZoneLookupResource',
         'api.OperatingHoursListResource',
         'api.OperatingHoursResource',
         'api.PromotionListResource',
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from datetime import date
 from decimal import Decimal
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from app import db
@@ -9,6 +10,10 @@ from app.utils.validation import BusinessValidationError
 from lib.ecode import ECode
 from werkzeug.security import generate_password_hash
 from app.routes.jwt import create_auth_token
+from app.utils.identity_cache import invalidate_identity_claims
+from app.utils.delivery_zone_index import delivery_zone_index
+from app.utils.menu_cache import build_menu_tree, cache_menu, get_cached_menu, get_menu_version, \
+    bump_menu_version
 
 
 class RestaurantEntity:
@@ -173,6 +178,7 @@ class RestaurantItemEntity:
 
         self.restaurant.deleted = True
         db.session.commit()
+        invalidate_identity_claims('restaurant', self.restaurant.id)
         logger.info("餐馆(ID=%s)删除成功", self.restaurant.id)
         return {'message': 'deleted successfully '}, ECode.SUCC
 
@@ -215,6 +221,7 @@ class MenuItemListEntity:
 
         db.session.add(menuitem)
         db.session.commit()
+        bump_menu_version(self.restaurant_id)
         logger.info("菜品创建成功",
                     getattr(self.restaurant, 'id', None),
                     id={menuitem.id},
@@ -228,6 +235,31 @@ class MenuItemListEntity:
                     self.restaurant_id, len(menus))
         return [menu.to_dict() for menu in menus], ECode.SUCC
 
+
+class RestaurantMenuEntity:
+    def __init__(self, current_user, restaurant_id):
+        self.current_user = current_user
+        self.restaurant_id = restaurant_id
+
+    """ 获取餐厅完整菜单（分类 -> 菜品 -> 选项组 -> 选项），返回序列化好的JSON """
+    def get_full_menu(self):
+        # 先取版本号再构建，构建期间菜单被修改时缓存会标记为旧版本
+        version = get_menu_version(self.restaurant_id)
+        payload = get_cached_menu(self.restaurant_id, version)
+        if payload is not None:
+            return payload, ECode.SUCC
+
+        restaurant = Restaurant.query.get(self.restaurant_id)
+        if not restaurant or restaurant.deleted:
+            logger.warning("获取完整菜单失败，餐馆ID=%s 不存在", self.restaurant_id)
+            raise BusinessValidationError("Restaurant not found", ECode.NOTFOUND)
+
+        tree = build_menu_tree(self.restaurant_id)
+        payload = cache_menu(self.restaurant_id, version, tree)
+        logger.info("构建餐馆ID=%s 的完整菜单，分类数=%s", self.restaurant_id, len(tree['categories']))
+        return payload, ECode.SUCC
+
+
 class MenuItemEntity:
     def __init__(self, current_user, menuitem_id=None):
         self.current_user = current_user
@@ -294,6 +326,7 @@ class MenuItemEntity:
             self.menuitem.is_featured = data["is_featured"]
 
         db.session.commit()
+        bump_menu_version(self.restaurant_id)
         logger.info("菜品更新成功 (menuitem_id=%s, restaurant_id=%s)",
                     self.menuitem.id, self.restaurant_id)
         return self.menuitem.to_dict(), ECode.SUCC
@@ -309,6 +342,7 @@ class MenuItemEntity:
         self.menuitem.deleted = True
 
         db.session.commit()
+        bump_menu_version(self.menuitem.restaurant_id)
         return {"message": "Menu item deleted successfully"}, ECode.SUCC
 
 
@@ -334,6 +368,7 @@ class MenuCategoryListEntity:
         )
         db.session.add(category)
         db.session.commit()
+        bump_menu_version(self.restaurant_id)
         logger.info("菜单分类创建成功 (category_id=%s, restaurant_id=%s, name=%s)",
                     category.id, self.restaurant_id, category.name)
         return category.to_dict(), ECode.SUCC
@@ -377,6 +412,7 @@ class MenuCategoryEntity:
             self.menucategory.display_order = data['display_order']
 
         db.session.commit()
+        bump_menu_version(self.restaurant_id)
         logger.info("menu_category updated successfully")
         return self.menucategory.to_dict(), ECode.SUCC
 
@@ -389,6 +425,7 @@ class MenuCategoryEntity:
 
         self.menucategory.deleted = True
         db.session.commit()
+        bump_menu_version(self.menucategory.restaurant_id)
         logger.info("menu_category deleted successfully")
         return {'message': 'deleted successfully '}, ECode.SUCC
 
@@ -423,6 +460,7 @@ class MenuOptionGroupListEntity:
          )
          db.session.add(group)
          db.session.commit()
+         bump_menu_version(self.restaurant_id)
          logger.info("menu_group created successfully")
          return group.to_dict(), ECode.SUCC
 
@@ -461,6 +499,7 @@ class MenuOptionGroupEntity:
                 self.group.min_selections = data["min_selections"]
 
             db.session.commit()
+            bump_menu_version(self.restaurant_id)
             logger.info("menu_group updated successfully")
             return self.group.to_dict(), ECode.SUCC
 
@@ -472,6 +511,7 @@ class MenuOptionGroupEntity:
 
             self.group.deleted = True
             db.session.commit()
+            bump_menu_version(self.restaurant_id)
             logger.info("menu_group deleted successfully")
             return {"message": "deleted successfully"}, ECode.SUCC
 
@@ -506,6 +546,7 @@ class MenuOptionListEntity:
         )
         db.session.add(option)
         db.session.commit()
+        bump_menu_version(self.group.menu_item.restaurant_id)
         logger.info("option created successfully")
         return option.to_dict(), ECode.SUCC
 
@@ -534,6 +575,7 @@ class MenuOptionEntity:
         if 'price' in data:
             self.option.price = Decimal(data['price'])
         db.session.commit()
+        bump_menu_version(self.option.option_group.menu_item.restaurant_id)
         logger.info("menu_option updated successfully")
         return self.option.to_dict(), ECode.SUCC
 
@@ -544,6 +586,7 @@ class MenuOptionEntity:
 
         self.option.deleted = True
         db.session.commit()
+        bump_menu_version(self.option.option_group.menu_item.restaurant_id)
         logger.info("menu_option deleted successfully")
         return {"message": "deleted successfully"}, ECode.SUCC
 
@@ -616,6 +659,7 @@ class DeliveryZoneEntity:
             self.delivery_zone.delivery_time = data['delivery_time']
 
         db.session.commit()
+        delivery_zone_index.update_zone(self.delivery_zone)
         logger.info("delivery_zone updated successfully")
         return self.delivery_zone.to_dict(), ECode.SUCC
 
@@ -626,6 +670,7 @@ class DeliveryZoneEntity:
 
         self.delivery_zone.deleted = True
         db.session.commit()
+        delivery_zone_index.update_zone(self.delivery_zone)
         logger.info('delivery_zone deleted successfully')
         return {"message": "deleted successfully"}, ECode.SUCC
 
@@ -640,12 +685,21 @@ class DeliveryPolygonListEntity:
             logger.warning('Permission denied')
             raise BusinessValidationError("Permission denied", ECode.FORBID)
 
+        if not self.zone or self.zone.deleted:
+            logger.warning("Delivery zone not found")
+            raise BusinessValidationError("Delivery zone not found", ECode.NOTFOUND)
+
+        if len(data["coordinates"]) < 3:
+            logger.warning("Polygon needs at least 3 points")
+            raise BusinessValidationError("Polygon needs at least 3 points", ECode.PARAM)
+
         polygon = DeliveryPolygon(
             coordinates=data["coordinates"],
             zone_id=self.zone_id
         )
         db.session.add(polygon)
         db.session.commit()
+        delivery_zone_index.add_polygon(polygon, self.zone)
         logger.info("polygon created successfully")
         return polygon.to_dict(), ECode.SUCC
 
@@ -674,8 +728,26 @@ class DeliveryPolygonEntity:
         polygon = DeliveryPolygon.query.get(polygon_id)
         db.session.delete(polygon)
         db.session.commit()
+        delivery_zone_index.remove_polygon(polygon_id)
         return {"message": "Deleted"}, ECode.SUCC
 
+class DeliveryZoneLookupEntity:
+    def __init__(self, current_user):
+        self.current_user = current_user
+
+    def lookup(self, lat, lng):
+        """
+        查询配送到该坐标的所有配送区域（含配送费和起送价）
+        """
+        if lat is None or lng is None or not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
+            logger.warning("Invalid coordinates: lat=%s, lng=%s", lat, lng)
+            raise BusinessValidationError("Invalid coordinates", ECode.PARAM)
+
+        zones = delivery_zone_index.lookup(lat, lng)
+        logger.info("delivery zone lookup (%s, %s) matched %s zones", lat, lng, len(zones))
+        return zones, ECode.SUCC
+
+
 class OperatingHoursListEntity:
     def __init__(self, current_user, restaurant_id):
         self.current_user = current_user
@@ -852,17 +924,26 @@ class RestaurantStatisticsEntity:
             logger.warning('Restaurant not found')
             raise BusinessValidationError("Restaurant not found", ECode.NOTFOUND)
 
-    def list_statistics(self):
+    def list_statistics(self, start_date=None, end_date=None):
         """
-        获取餐馆的所有统计历史数据（管理员专用）
+        获取餐馆的统计历史数据（管理员专用），可按日期区间（YYYY-MM-DD，含首尾）筛选
+
+        统计数据由 tasks.db_tasks.rollup_restaurant_statistics 每日汇总写入
         """
         if not self.current_user.is_admin and self.restaurant_id:
             logger.warning("Permission denied")
             raise BusinessValidationError("Permission denied", ECode.FORBID)
 
-        stats = RestaurantStatistics.query.filter_by(restaurant_id=self.restaurant_id).order_by(
-            RestaurantStatistics.date.desc()
-        ).all()
+        query = RestaurantStatistics.query.filter_by(restaurant_id=self.restaurant_id)
+        try:
+            if start_date:
+                query = query.filter(RestaurantStatistics.date >= date.fromisoformat(start_date))
+            if end_date:
+                query = query.filter(RestaurantStatistics.date <= date.fromisoformat(end_date))
+        except ValueError:
+            raise BusinessValidationError("Invalid date, expected YYYY-MM-DD", ECode.PARAM)
+
+        stats = query.order_by(RestaurantStatistics.date.desc()).all()
         logger.info('acquire list statistics')
         return [s.to_dict() for s in stats], ECode.SUCC
 
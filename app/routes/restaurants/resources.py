@@ -1,18 +1,19 @@
 # -*- coding: utf-8 -*-
-from flask import request
+from flask import request, current_app
 
 from flask_restful import Resource
 from app.routes.restaurants.entities import RestaurantEntity, RestaurantItemEntity, MenuItemListEntity, \
     MenuCategoryEntity, MenuItemEntity, MenuCategoryListEntity, MenuOptionGroupListEntity, MenuOptionGroupEntity, \
     MenuOptionListEntity, MenuOptionEntity, DeliveryZoneListEntity, DeliveryZoneEntity, OperatingHoursListEntity, \
     OperatingHoursEntity, PromotionListEntity, PromotionEntity, DeliveryPolygonListEntity, DeliveryPolygonEntity, \
-    RestaurantStatisticsEntity
+    RestaurantStatisticsEntity, DeliveryZoneLookupEntity, RestaurantMenuEntity
 from app.schemas.restaurants.restaurant_schema import Restaurant, RestaurantLoginSchema, UpdateRestaurant, \
     MenuCategorySchema, UpdateMenuItemSchema, MenuItemSchema, MenuOptionGroupSchema, UpdateMenuOptionGroupSchema, \
     MenuOptionSchema, DeliveryZoneSchema, OperatingHoursSchema, UpdateOperatingHoursSchema, PromotionSchema, \
     UpdatePromotionSchema, DeliveryPolygonCreateSchema
 from app.utils.validation import validate_request
-from app.routes.jwt import current_user, restaurant_required, admin_required
+from app.routes.jwt import current_user, restaurant_required, admin_required, user_required, require_role
+from app.utils.menu_cache import menu_conditional_get
 
 
 class RestaurantListResource(Resource):
@@ -80,6 +81,7 @@ class MenuItemListResource(Resource):
         return entity.create_menuitem(data)
 
     @restaurant_required
+    @menu_conditional_get
     def get(self, restaurant_id):
         entity = MenuItemListEntity(
             current_user=current_user,
@@ -87,6 +89,23 @@ class MenuItemListResource(Resource):
         )
         return entity.get_all_menuitem()
 
+
+class RestaurantMenuResource(Resource):
+    endpoint = 'api.RestaurantMenuResource'
+
+    @require_role('any')
+    @menu_conditional_get
+    def get(self, restaurant_id):
+        """获取餐厅完整菜单树"""
+        entity = RestaurantMenuEntity(
+            current_user=current_user,
+            restaurant_id=restaurant_id
+        )
+        payload, code = entity.get_full_menu()
+        # 缓存中已是序列化好的JSON，直接输出
+        return current_app.response_class(payload, status=code, mimetype='application/json')
+
+
 class MenuItemResource(Resource):
     endpoint = 'api.MenuItemResource'
 
@@ -132,6 +151,7 @@ class MenuCategoryListResource(Resource):
         return entity.create_menu_category(data)
 
     @restaurant_required
+    @menu_conditional_get
     def get(self, restaurant_id):
         entity = MenuCategoryListEntity(
             current_user=current_user,
@@ -324,6 +344,21 @@ class DeliveryPolygonResource(Resource):
         )
         return entity.delete_polygon(polygon_id)
 
+class DeliveryZoneLookupResource(Resource):
+    endpoint = 'api.DeliveryZoneLookupResource'
+    """
+    配送区域查询接口
+    - GET: 查询配送到指定坐标的餐馆配送区域 ?lat=&lng=
+    """
+    @user_required
+    def get(self):
+        entity = DeliveryZoneLookupEntity(current_user=current_user)
+        return entity.lookup(
+            request.args.get('lat', type=float),
+            request.args.get('lng', type=float)
+        )
+
+
 class OperatingHoursListResource(Resource):
     endpoint = 'api.OperatingHoursListResource'
 
@@ -410,7 +445,7 @@ class PromotionResource(Resource):
 class RestaurantStatisticsListResource(Resource):
     """
     餐馆统计信息接口（历史数据）
-    - GET: 获取某餐馆的所有统计历史数据
+    - GET: 获取某餐馆的统计历史数据，可选 start_date / end_date
     """
     @restaurant_required
     def get(self, restaurant_id):
@@ -419,7 +454,10 @@ class RestaurantStatisticsListResource(Resource):
             restaurant_id=restaurant_id
         )
 
-        return entity.list_statistics()
+        return entity.list_statistics(
+            start_date=request.args.get("start_date"),
+            end_date=request.args.get("end_date")
+        )
 
 class RestaurantStatisticsResource(Resource):
     """
@@ -1,14 +1,16 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
-from flask import json
 from werkzeug.security import generate_password_hash
 from app import db
 from app.models import Rider, RiderLocation
 from app.routes.jwt import create_auth_token
 from app.routes.logger import logger
+from app.utils.identity_cache import invalidate_identity_claims
+from app.utils.pagination import cursor_paginate
 from app.utils.validation import BusinessValidationError
 from app.utils.notifications import notify_rider_new_order
-from extensions.redis_sync import get_redis_client
+from app.utils.rider_geo import set_rider_dispatch_state
+from app.utils.rider_location import read_location_history
 from lib.ecode import ECode
 
 
@@ -38,12 +40,13 @@ class RiderEntity:
          )
         db.session.add(rider)
         db.session.commit()
+        set_rider_dispatch_state(rider)
         logger.info(f'Created rider {rider.name}')
         return rider.to_dict(), ECode.SUCC
 
     """获取全部骑手（仅管理员）"""
 
-    def get_all_riders(self, **filters):
+    def get_all_riders(self, cursor=None, per_page=20, with_total=False, **filters):
         # 权限检查 - 只有管理员可以访问
         if not self.current_user or not self.current_user.is_admin:
             logger.warning(f"未授权访问尝试: 用户 {getattr(self.current_user, 'id', 'unknown')} 尝试访问骑手列表")
@@ -64,12 +67,10 @@ class RiderEntity:
         if 'phone' in filters and filters['phone']:
             query = query.filter(Rider.phone.ilike(f"%{filters['phone']}%"))
 
-        # 排序
-        query = query.order_by(Rider.created_at.desc())
-
-        riders = query.all()
-        logger.info(f"管理员 {self.current_user.id} 成功查询骑手列表，找到 {len(riders)} 条记录")
-        return [r.to_dict() for r in riders], ECode.SUCC
+        # 按 (created_at, id) 倒序游标分页
+        result = cursor_paginate(query, Rider, cursor, per_page, with_total)
+        logger.info(f"管理员 {self.current_user.id} 成功查询骑手列表，本页 {len(result['items'])} 条记录")
+        return result, ECode.SUCC
 
     def rider_login(self, data):
         # 1. 根据邮箱查询骑手（排除已删除的）
@@ -111,6 +112,7 @@ class RiderEntity:
         rider.is_available = False
         rider.last_login = datetime.now()
         db.session.commit()
+        set_rider_dispatch_state(rider)
         return {'msg':'logout successfully'}, ECode.SUCC
 
     def start_taking_orders(self):
@@ -120,6 +122,7 @@ class RiderEntity:
         rider.is_online = True
         rider.is_available = True
         db.session.commit()
+        set_rider_dispatch_state(rider)
         return rider.to_dict(), ECode.SUCC
 
     def stop_taking_orders(self):
@@ -128,6 +131,7 @@ class RiderEntity:
             raise BusinessValidationError('Rider not found', ECode.FORBID)
         rider.is_available = False
         db.session.commit()
+        set_rider_dispatch_state(rider)
         return rider.to_dict(), ECode.SUCC
 
 
@@ -175,9 +179,10 @@ class RiderItemEntity:
             raise BusinessValidationError("Permission denied", ECode.FORBID)
         self.rider.deleted = True
         db.session.commit()
+        set_rider_dispatch_state(self.rider)
+        invalidate_identity_claims('rider', self.rider.id)
         return {'message': 'deleted successfully'}, ECode.SUCC
 
-# 有错误没有修改。。。。
 class RiderLocationEntity:
     def __init__(self, current_user, rider_id):
         self.current_user = current_user
@@ -187,31 +192,15 @@ class RiderLocationEntity:
             raise BusinessValidationError("Rider not found", ECode.NOTFOUND)
 
     def get_location_history(self, limit=50, order_id=None):
-        """获取骑手历史位置"""
-        key = f"rider_locations:{self.rider_id}"
+        """获取骑手历史位置，优先读取Redis轨迹，没有时回退到数据库"""
+        history = read_location_history(self.rider_id, limit=limit)
         if order_id:
-            redis_client = get_redis_client()
-            history = redis_client.zrevrange(key, 0, limit - 1)
-            if history:
-                filtered =[
-                    json.loads(h) for h in history
-                    if json.loads(h).get("order_id") == order_id
-
-                ]
-                if filtered:
-                    return filtered[:limit], ECode.SUCC
-
-            history_db = (
-                RiderLocation.query.filter_by(rider_id=self.rider_id)
-                .order_by(RiderLocation.timestamp.desc())
-                .limit(limit)
-                .all()
-            )
-            return [loc.to_dict() for loc in history_db], ECode.SUCC
-        return None
-
-
-
-
-
+            history = [h for h in history if h.get("order_id") == order_id]
+        if history:
+            return history[:limit], ECode.SUCC
 
+        query = RiderLocation.query.filter_by(rider_id=self.rider_id)
+        if order_id:
+            query = query.filter_by(order_id=order_id)
+        history_db = query.order_by(RiderLocation.timestamp.desc()).limit(limit).all()
+        return [loc.to_dict() for loc in history_db], ECode.SUCC
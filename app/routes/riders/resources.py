@@ -5,6 +5,7 @@ from app.routes.jwt import rider_required, current_user, admin_required
 from app.routes.riders.entities import RiderEntity, RiderItemEntity, RiderLocationEntity
 from app.schemas.rider.rider_schema import RiderSchema, UpdateRiderSchema, RiderLoginSchema
 
+from app.utils.pagination import pagination_args
 from app.utils.validation import validate_request
 
 
@@ -14,7 +15,15 @@ class RiderListResource(Resource):
     @admin_required
     def get(self):
         entity = RiderEntity(current_user=current_user)
-        return entity.get_all_riders()
+        filters = {}
+        if request.args.get('is_online') is not None:
+            filters['is_online'] = request.args.get('is_online').lower() in ('1', 'true')
+        if request.args.get('is_available') is not None:
+            filters['is_available'] = request.args.get('is_available').lower() in ('1', 'true')
+        for key in ('name', 'phone'):
+            if request.args.get(key):
+                filters[key] = request.args.get(key)
+        return entity.get_all_riders(**pagination_args(request.args), **filters)
 
     def post(self):
         data = validate_request(RiderSchema, request.get_json())
@@ -92,10 +101,11 @@ class RiderLocationHistoryResource(Resource):
     @rider_required
     def get(self, rider_id):
         limit = request.args.get("limit", 50, type=int)
+        order_id = request.args.get("order_id", type=int)
         entity = RiderLocationEntity(
             current_user=current_user,
             rider_id=rider_id)
-        return entity.get_location_history(limit)
+        return entity.get_location_history(limit, order_id=order_id)
 
 
 
@@ -8,6 +8,8 @@ import re
 
 from app.models.users.user import User, UserAddress, UserCoupon
 from app import db
+from app.utils.identity_cache import invalidate_identity_claims
+from app.utils.pagination import cursor_paginate
 from app.utils.validation import BusinessValidationError
 from werkzeug.security import generate_password_hash
 from app.routes.jwt import create_auth_token
@@ -19,7 +21,7 @@ class UserEntity:
     def __init__(self, current_user=None):
         self.current_user = current_user
 
-    def get_users(self, **filters):
+    def get_users(self, cursor=None, per_page=20, with_total=False, **filters):
         # 只有管理员可以查看用户列表
         if not self.current_user or not self.current_user.is_admin:
             logger.error("Permission denied")
@@ -33,8 +35,7 @@ class UserEntity:
         if 'email' in filters:
             query = query.filter(User.email == filters['email'])
 
-        users = query.all()
-        return [u.to_dict() for u in users], ECode.SUCC
+        return cursor_paginate(query, User, cursor, per_page, with_total), ECode.SUCC
 
     def create_user(self, data):
         # 只有管理员可以创建用户
@@ -151,6 +152,7 @@ class UserItemEntity:
             self.user.is_admin = data['is_admin']
 
         db.session.commit()
+        invalidate_identity_claims('user', self.user_id)
         return self.user.to_dict(), ECode.SUCC
 
     def delete_user(self):
@@ -164,6 +166,7 @@ class UserItemEntity:
 
         self.user.deleted = True
         db.session.commit()
+        invalidate_identity_claims('user', self.user_id)
         return {"message": "User deleted successfully"}
 
 class UserAddressListEntity:
@@ -9,6 +9,7 @@ from flask_restful import Resource
 from flask import request
 from .entities import UserEntity, UserItemEntity, UserAddressEntity, UserAddressListEntity, UserCouponEntity
 from app.schemas.user.user import UserCreateSchema, UserUpdateSchema, LoginSchema, UserAddressSchema
+from app.utils.pagination import pagination_args
 from app.utils.validation import validate_request, BusinessValidationError
 from app.routes.jwt import current_user, admin_required, user_required
 from app.routes.logger import logger
@@ -22,8 +23,8 @@ class UserListResource(Resource):
             raise BusinessValidationError("Permission denied", 403)
 
         entity = UserEntity(current_user=current_user)
-        logger.info(entity.get_users(**request.args))
-        return entity.get_users(**request.args)
+        filters = {k: v for k, v in request.args.items() if k in ('username', 'email')}
+        return entity.get_users(**pagination_args(request.args), **filters)
 
     @admin_required
     def post(self):
@@ -31,7 +31,7 @@ class PaymentSchema(BaseSchema):
         description="支付方式"
     )
     status: PaymentStatus = Field(
-        default=PaymentStatus.PENDING,
+        default=PaymentStatus.STATUS_PENDING,
         description="支付状态"
     )
 
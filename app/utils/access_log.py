@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/28 16:05
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : access_log.py
+# @Software: PyCharm
+
+# ==============================
+# 访问日志
+# ==============================
+# 每个请求在结束时最多记录一条结构化日志（方法、路由模板、状态码、耗时、用户ID）。
+# 2xx/3xx 响应按 ACCESS_LOG_SAMPLE_RATE 采样，4xx/5xx 和超过 ACCESS_LOG_SLOW_MS 的慢请求总是记录。
+import logging
+import random
+import time
+
+from flask import g, request
+
+access_logger = logging.getLogger('app.access')
+
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_SLOW_MS = 1000
+DEFAULT_SKIP_PATHS = ('/health', '/metrics', '/favicon.ico')
+
+
+def init_access_log(app):
+    """注册访问日志中间件"""
+    sample_rate = float(app.config.get('ACCESS_LOG_SAMPLE_RATE', DEFAULT_SAMPLE_RATE))
+    slow_ms = float(app.config.get('ACCESS_LOG_SLOW_MS', DEFAULT_SLOW_MS))
+    skip_paths = frozenset(app.config.get('ACCESS_LOG_SKIP_PATHS', DEFAULT_SKIP_PATHS))
+
+    @app.before_request
+    def start_access_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def log_access(response):
+        started = g.get('_request_started')
+        if started is None:
+            return response
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        status = response.status_code
+        if status >= 500:
+            level = logging.ERROR
+        elif status >= 400 or latency_ms >= slow_ms:
+            level = logging.WARNING
+        elif request.path in skip_paths or random.random() >= sample_rate:
+            return response
+        else:
+            level = logging.INFO
+
+        if not access_logger.isEnabledFor(level):
+            return response
+
+        # 只读取鉴权装饰器已解析的身份，不为记录日志额外解析JWT或查询数据库
+        identity = g.get('_jwt_identity') or {}
+        route = request.url_rule.rule if request.url_rule is not None else None
+        access = {
+            'method': request.method,
+            'route': route,
+            'path': request.path,
+            'status': status,
+            'latency_ms': round(latency_ms, 2),
+            'ip': request.remote_addr,
+            'identity_type': identity.get('type'),
+        }
+        access_logger.log(
+            level, '%s %s %s %.1fms', request.method, route or request.path, status, latency_ms,
+            extra={
+                'access': access,
+                'user_id': identity.get('id'),
+                'request_id': request.headers.get('X-Request-ID'),
+            }
+        )
+        return response
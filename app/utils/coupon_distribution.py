@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/30 14:25
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : coupon_distribution.py
+# @Software: PyCharm
+
+# ==============================
+# 优惠券批量发放
+# ==============================
+# 按用户ID分块，每块执行一条 INSERT ... SELECT（NOT EXISTS 反连接），不把用户加载到内存；
+# user_coupons 上的 (user_id, coupon_id) 唯一约束保证并发或重复执行时不会重复发放。
+# 每块提交后把进度写入Redis hash coupon_distribution:{coupon_id}，中断后再次执行从上次完成的块继续。
+import logging
+import time
+from datetime import datetime
+
+from redis.exceptions import WatchError
+
+from app import db
+from app.utils.validation import BusinessValidationError
+from lib.ecode import ECode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+PROGRESS_TTL = 7 * 24 * 3600
+ACTIVE_STALE_AFTER = 1800  # 排队或执行中的进度超过30分钟未更新，视为任务已中断
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def progress_key(coupon_id):
+    return f"coupon_distribution:{coupon_id}"
+
+
+def get_distribution_progress(redis_client, coupon_id):
+    """获取发放进度：status / last_user_id / processed / inserted / skipped / chunks / updated_at"""
+    if redis_client is None:
+        return None
+    return redis_client.hgetall(progress_key(coupon_id)) or None
+
+
+def _save_progress(redis_client, coupon_id, progress):
+    if redis_client is None:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(progress_key(coupon_id), mapping=progress)
+        pipe.expire(progress_key(coupon_id), PROGRESS_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"保存优惠券发放进度失败 (coupon_id={coupon_id}): {e}")
+
+
+def _is_active(progress):
+    """排队或执行中，且在 ACTIVE_STALE_AFTER 内有更新（超时视为任务已中断，允许重新发起）"""
+    if not progress or progress.get('status') not in (STATUS_QUEUED, STATUS_RUNNING):
+        return False
+    try:
+        updated_at = datetime.fromisoformat(progress.get('updated_at', ''))
+    except ValueError:
+        return False
+    return (datetime.now() - updated_at).total_seconds() < ACTIVE_STALE_AFTER
+
+
+def mark_distribution_queued(redis_client, coupon_id, task_id=None, restart=False):
+    """
+    投递异步发放任务前记录排队状态，便于进度接口立即可查
+
+    已有排队或执行中的发放时抛出 CONFLICT，避免两个任务同时处理同一用户区间；
+    检查和写入在 WATCH 事务中完成，并发请求只有一个成功。
+    已完成的进度或 restart 时先清空旧进度，避免排队状态被当作未完成进度续发；
+    未完成的进度保留 last_user_id 等字段，任务执行时从断点继续。
+    """
+    if redis_client is None:
+        return
+    key = progress_key(coupon_id)
+    with redis_client.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            progress = pipe.hgetall(key)
+            if _is_active(progress):
+                raise BusinessValidationError("Coupon distribution already in progress", ECode.CONFLICT)
+            pipe.multi()
+            if restart or progress.get('status') == STATUS_DONE:
+                pipe.delete(key)
+            pipe.hset(key, mapping={
+                'status': STATUS_QUEUED,
+                'task_id': task_id or '',
+                'updated_at': datetime.now().isoformat(),
+            })
+            pipe.expire(key, PROGRESS_TTL)
+            pipe.execute()
+        except WatchError:
+            raise BusinessValidationError("Coupon distribution already in progress", ECode.CONFLICT)
+
+
+def mark_distribution_failed(redis_client, coupon_id):
+    """发放任务未能投递时标记失败，允许立即重新发起"""
+    _save_progress(redis_client, coupon_id, {'status': STATUS_FAILED, 'updated_at': datetime.now().isoformat()})
+
+
+def distribute_coupon_to_users(coupon_id, redis_client=None, chunk_size=DEFAULT_CHUNK_SIZE, restart=False):
+    """
+    将优惠券发放给所有未删除且尚未持有该券的用户
+
+    Args:
+        redis_client: 用于记录进度和断点续发，为None时每次从头执行（已发放的用户会被跳过）
+        restart: 忽略已有进度，从第一个用户重新检查
+
+    Returns:
+        dict: processed（检查的用户数）、inserted（新发放数）、skipped（已持有跳过数）、chunks
+    """
+    from app.models import User, UserCoupon
+
+    progress = None if restart else get_distribution_progress(redis_client, coupon_id)
+    if progress and progress.get('status') != STATUS_DONE:
+        last_user_id = int(progress.get('last_user_id', 0))
+        processed = int(progress.get('processed', 0))
+        inserted = int(progress.get('inserted', 0))
+        chunks = int(progress.get('chunks', 0))
+        logger.info(f"优惠券 {coupon_id} 从用户ID {last_user_id} 之后继续发放")
+    else:
+        last_user_id = processed = inserted = chunks = 0
+
+    started = time.time()
+    while True:
+        # 本块的用户ID上界和用户数
+        chunk_ids = db.select(User.id).where(
+            User.deleted == False, User.id > last_user_id
+        ).order_by(User.id).limit(chunk_size).subquery()
+        chunk_users, upper_id = db.session.execute(
+            db.select(db.func.count(), db.func.max(chunk_ids.c.id))
+        ).one()
+        if not chunk_users:
+            break
+
+        now = datetime.now()
+        candidates = db.select(
+            User.id,
+            db.literal(coupon_id),
+            db.literal(UserCoupon.STATUS_UNUSED),
+            db.literal(now),
+            db.literal(now),
+            db.literal(False),
+        ).where(
+            User.deleted == False,
+            User.id > last_user_id,
+            User.id <= upper_id,
+            ~db.exists().where(UserCoupon.user_id == User.id, UserCoupon.coupon_id == coupon_id)
+        )
+        try:
+            result = db.session.execute(db.insert(UserCoupon).from_select(
+                ['user_id', 'coupon_id', 'status', 'created_at', 'updated_at', 'deleted'], candidates
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            _save_progress(redis_client, coupon_id, {'status': STATUS_FAILED, 'updated_at': now.isoformat()})
+            raise
+
+        last_user_id = upper_id
+        processed += chunk_users
+        inserted += max(result.rowcount, 0)
+        chunks += 1
+        _save_progress(redis_client, coupon_id, {
+            'status': STATUS_RUNNING,
+            'last_user_id': last_user_id,
+            'processed': processed,
+            'inserted': inserted,
+            'skipped': processed - inserted,
+            'chunks': chunks,
+            'updated_at': now.isoformat(),
+        })
+        logger.info(f"优惠券 {coupon_id} 发放进度: 第 {chunks} 块，已检查 {processed} 个用户，新发放 {inserted} 张")
+
+    _save_progress(redis_client, coupon_id, {
+        'status': STATUS_DONE,
+        'last_user_id': last_user_id,
+        'processed': processed,
+        'inserted': inserted,
+        'skipped': processed - inserted,
+        'chunks': chunks,
+        'updated_at': datetime.now().isoformat(),
+    })
+    logger.info(f"优惠券 {coupon_id} 发放完成，检查 {processed} 个用户，新发放 {inserted} 张，"
+                f"耗时 {time.time() - started:.1f}s")
+    return {'processed': processed, 'inserted': inserted, 'skipped': processed - inserted, 'chunks': chunks}
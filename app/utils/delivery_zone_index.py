@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/24 22:16
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : delivery_zone_index.py
+# @Software: PyCharm
+
+# ==============================
+# 配送区域空间索引（进程内）
+# ==============================
+# 将所有 DeliveryPolygon 的外接矩形登记到经纬度网格中，查询时只对所在网格内、
+# 外接矩形命中的多边形做射线法判断。
+# 多进程部署时各进程各自持有索引，通过 Redis 中的版本号感知其他进程的修改。
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+from app.utils.geo import point_in_polygon
+from extensions.redis_sync import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+ZONE_INDEX_VERSION_KEY = 'delivery_zone_index:version'
+GRID_SIZE = 0.05  # 网格边长（度），约5公里
+VERSION_CHECK_INTERVAL = 5  # 检查其他进程修改的间隔（秒）
+
+
+class _PolygonEntry:
+    __slots__ = ('polygon_id', 'zone_id', 'lats', 'lons', 'bbox', 'cells')
+
+    def __init__(self, polygon_id, zone_id, coordinates):
+        self.polygon_id = polygon_id
+        self.zone_id = zone_id
+        # 坐标格式 [[lng, lat], [lng, lat], ...]
+        points = np.asarray(coordinates, dtype=np.float64)
+        self.lons = points[:, 0]
+        self.lats = points[:, 1]
+        self.bbox = (self.lats.min(), self.lons.min(), self.lats.max(), self.lons.max())
+        self.cells = list(_cells_for_bbox(self.bbox))
+
+    def contains(self, lat, lon):
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        if lat < min_lat or lat > max_lat or lon < min_lon or lon > max_lon:
+            return False
+        return point_in_polygon(lat, lon, self.lats, self.lons)
+
+
+def _cell(lat, lon):
+    return math.floor(lat / GRID_SIZE), math.floor(lon / GRID_SIZE)
+
+
+def _cells_for_bbox(bbox):
+    min_row, min_col = _cell(bbox[0], bbox[1])
+    max_row, max_col = _cell(bbox[2], bbox[3])
+    for row in range(min_row, max_row + 1):
+        for col in range(min_col, max_col + 1):
+            yield row, col
+
+
+def _valid_coordinates(coordinates):
+    try:
+        return len(coordinates) >= 3 and all(len(point) == 2 for point in coordinates)
+    except TypeError:
+        return False
+
+
+class DeliveryZoneIndex:
+    """配送区域索引，查询某个坐标落在哪些配送区域内"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._polygons = {}  # polygon_id -> _PolygonEntry
+        self._grid = {}  # (row, col) -> set(polygon_id)
+        self._zones = {}  # zone_id -> 区域信息
+        self._loaded = False
+        self._version = None
+        self._checked_at = 0
+
+    # ---------- 构建与增量维护 ----------
+
+    def rebuild(self):
+        """从数据库全量加载未删除的配送区域和多边形"""
+        from app import db
+        from app.models import DeliveryZone, DeliveryPolygon
+
+        rows = db.session.query(DeliveryPolygon, DeliveryZone).join(
+            DeliveryZone, DeliveryPolygon.zone_id == DeliveryZone.id
+        ).filter(
+            DeliveryPolygon.deleted == False,
+            DeliveryZone.deleted == False
+        ).all()
+
+        with self._lock:
+            self._polygons = {}
+            self._grid = {}
+            self._zones = {}
+            for polygon, zone in rows:
+                self._add(polygon, zone)
+            self._loaded = True
+            self._version = self._remote_version()
+            self._checked_at = time.time()
+        logger.info(f"配送区域索引构建完成，共 {len(self._polygons)} 个多边形")
+
+    def add_polygon(self, polygon, zone):
+        """新增或替换一个多边形"""
+        with self._lock:
+            if self._loaded:
+                self._remove(polygon.id)
+                self._add(polygon, zone)
+        self._bump_version()
+
+    def remove_polygon(self, polygon_id):
+        """移除一个多边形"""
+        with self._lock:
+            if self._loaded:
+                self._remove(polygon_id)
+        self._bump_version()
+
+    def update_zone(self, zone):
+        """配送区域信息（配送费、起送价等）变更或删除"""
+        with self._lock:
+            if self._loaded:
+                if zone.deleted:
+                    for polygon_id in [p.polygon_id for p in self._polygons.values() if p.zone_id == zone.id]:
+                        self._remove(polygon_id)
+                    self._zones.pop(zone.id, None)
+                elif zone.id in self._zones:
+                    self._zones[zone.id] = self._zone_info(zone)
+        self._bump_version()
+
+    def _add(self, polygon, zone):
+        if not _valid_coordinates(polygon.coordinates):
+            logger.warning(f"配送多边形坐标无效，跳过 (polygon_id={polygon.id})")
+            return
+        entry = _PolygonEntry(polygon.id, zone.id, polygon.coordinates)
+        self._polygons[entry.polygon_id] = entry
+        self._zones[zone.id] = self._zone_info(zone)
+        for cell in entry.cells:
+            self._grid.setdefault(cell, set()).add(entry.polygon_id)
+
+    def _remove(self, polygon_id):
+        entry = self._polygons.pop(polygon_id, None)
+        if entry is None:
+            return
+        for cell in entry.cells:
+            bucket = self._grid.get(cell)
+            if bucket:
+                bucket.discard(polygon_id)
+                if not bucket:
+                    del self._grid[cell]
+
+    @staticmethod
+    def _zone_info(zone):
+        return {
+            'zone_id': zone.id,
+            'restaurant_id': zone.restaurant_id,
+            'name': zone.name,
+            'delivery_fee': zone.delivery_fee,
+            'min_order_amount': zone.min_order_amount,
+            'delivery_time': zone.delivery_time,
+        }
+
+    # ---------- 跨进程版本同步 ----------
+
+    def _remote_version(self):
+        redis_client = get_redis_client()
+        if redis_client is None:
+            return None
+        try:
+            return redis_client.get(ZONE_INDEX_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"读取配送区域索引版本失败: {e}")
+            return None
+
+    def _bump_version(self):
+        redis_client = get_redis_client()
+        if redis_client is None:
+            return
+        try:
+            new_version = redis_client.incr(ZONE_INDEX_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"更新配送区域索引版本失败: {e}")
+            return
+        with self._lock:
+            # 期间没有其他进程修改时本地索引已是最新，否则下次查询时重建
+            if self._version is not None and int(self._version) + 1 == new_version:
+                self._version = str(new_version)
+            else:
+                self._loaded = False
+
+    def _ensure_fresh(self):
+        if not self._loaded:
+            self.rebuild()
+            return
+
+        now = time.time()
+        if now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if self._remote_version() != self._version:
+            self.rebuild()
+
+    # ---------- 查询 ----------
+
+    def lookup(self, lat, lon):
+        """
+        查询坐标所在的配送区域
+
+        Returns:
+            list: 区域信息列表（zone_id, restaurant_id, name, delivery_fee, min_order_amount, delivery_time），
+                  按配送费升序
+        """
+        self._ensure_fresh()
+
+        with self._lock:
+            candidates = self._grid.get(_cell(lat, lon), ())
+            zone_ids = {
+                self._polygons[polygon_id].zone_id
+                for polygon_id in candidates
+                if self._polygons[polygon_id].contains(lat, lon)
+            }
+            zones = [dict(self._zones[zone_id]) for zone_id in zone_ids if zone_id in self._zones]
+
+        zones.sort(key=lambda z: (z['delivery_fee'] or 0, z['zone_id']))
+        return zones
+
+
+# 进程级单例
+delivery_zone_index = DeliveryZoneIndex()
@@ -1,8 +1,13 @@
 import math
 
+import numpy as np
+
+EARTH_RADIUS = 6371000  # 地球平均半径（米）
+
+
 def haversine(lat1, lon1, lat2, lon2):
     """计算两个经纬度点之间的球面距离（单位：米）"""
-    R = 6371000
+    R = EARTH_RADIUS
     phi1, phi2 = math.radians(lat1), math.radians(lat2)
     dphi = math.radians(lat2 - lat1)
     dlambda = math.radians(lon2 - lon1)
@@ -10,3 +15,123 @@ def haversine(lat1, lon1, lat2, lon2):
     a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     return R * c
+
+
+def haversine_many(lat, lon, lats, lons):
+    """计算一个点到多个点的球面距离（单位：米），返回 numpy 数组"""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    phi1 = math.radians(lat)
+
+    dphi = lats - phi1
+    dlambda = lons - math.radians(lon)
+
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(lats) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix(lats1, lons1, lats2, lons2):
+    """计算两组点之间的距离矩阵（单位：米），形状为 (len(lats1), len(lats2))"""
+    lats1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, np.newaxis]
+    lons1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, np.newaxis]
+    lats2 = np.radians(np.asarray(lats2, dtype=np.float64))[np.newaxis, :]
+    lons2 = np.radians(np.asarray(lons2, dtype=np.float64))[np.newaxis, :]
+
+    a = np.sin((lats2 - lats1) / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin((lons2 - lons1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def equirectangular_many(lat, lon, lats, lons):
+    """等距矩形投影近似距离（单位：米），短距离内误差很小，计算量远低于 haversine"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    x = np.radians(lons - lon) * math.cos(math.radians(lat))
+    y = np.radians(lats - lat)
+    return EARTH_RADIUS * np.hypot(x, y)
+
+
+def points_within_radius(lat, lon, lats, lons, radius, margin=1.1):
+    """
+    筛选半径内的点
+
+    先用等距矩形近似距离按 radius * margin 粗筛，再对剩余候选计算精确 haversine 距离。
+
+    Returns:
+        (indices, distances): 命中点在输入中的下标及其精确距离，按距离升序
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if lats.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+    # 粗筛：近似距离明显超出半径的点直接丢弃
+    candidates = np.flatnonzero(equirectangular_many(lat, lon, lats, lons) <= radius * margin)
+    if candidates.size == 0:
+        return candidates, np.empty(0, dtype=np.float64)
+
+    distances = haversine_many(lat, lon, lats[candidates], lons[candidates])
+    hit = distances <= radius
+    indices, distances = candidates[hit], distances[hit]
+
+    order = np.argsort(distances, kind='stable')
+    return indices[order], distances[order]
+
+
+def simplify_track(lats, lons, tolerance):
+    """
+    Douglas-Peucker 轨迹抽稀
+
+    将轨迹投影到平面（米）后递归保留偏离首尾连线超过 tolerance 米的点。
+
+    Returns:
+        numpy 数组：保留点在输入中的下标（升序，始终包含首尾点）
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = lats.size
+    if n < 3:
+        return np.arange(n)
+
+    # 以轨迹平均纬度做等距矩形投影
+    x = np.radians(lons) * math.cos(math.radians(lats.mean())) * EARTH_RADIUS
+    y = np.radians(lats) * EARTH_RADIUS
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        segment = math.hypot(dx, dy)
+        if segment == 0:
+            dist = np.hypot(px, py)
+        else:
+            dist = np.abs(dx * py - dy * px) / segment
+
+        idx = int(np.argmax(dist))
+        if dist[idx] > tolerance:
+            mid = start + 1 + idx
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+
+    return np.flatnonzero(keep)
+
+
+def point_in_polygon(lat, lon, lats, lons):
+    """射线法判断点是否在多边形内，lats/lons 为多边形顶点（首尾无需闭合）"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    prev_lats = np.roll(lats, 1)
+    prev_lons = np.roll(lons, 1)
+
+    # 统计从该点向东的射线与多边形边的交点个数
+    crosses = (lats > lat) != (prev_lats > lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cross_lons = (prev_lons - lons) * (lat - lats) / (prev_lats - lats) + lons
+    return bool(np.count_nonzero(crosses & (lon < cross_lons)) % 2)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/28 10:36
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : identity_cache.py
+# @Software: PyCharm
+
+# ==============================
+# 身份声明缓存
+# ==============================
+# 只缓存鉴权需要的轻量字段（id / is_admin），两级缓存：
+#   进程内字典  AUTH_CLAIMS_LOCAL_TTL 秒，避免同一进程内的重复Redis往返
+#   Redis      auth:claims:{kind}:{id}，AUTH_CLAIMS_CACHE_TTL 秒，多进程共享
+# 任一TTL配置为0即关闭对应层级。身份信息变更（如修改管理员状态、删除）时调用 invalidate_identity_claims。
+import logging
+import threading
+import time
+
+from flask import current_app
+
+from extensions.redis_sync import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLAIMS_CACHE_TTL = 60
+DEFAULT_CLAIMS_LOCAL_TTL = 5
+LOCAL_CACHE_MAX = 10000
+
+_local_cache = {}
+_local_lock = threading.Lock()
+
+
+def claims_key(kind, identity_id):
+    return f"auth:claims:{kind}:{identity_id}"
+
+
+def _ttls():
+    config = current_app.config
+    return (int(config.get('AUTH_CLAIMS_CACHE_TTL', DEFAULT_CLAIMS_CACHE_TTL)),
+            int(config.get('AUTH_CLAIMS_LOCAL_TTL', DEFAULT_CLAIMS_LOCAL_TTL)))
+
+
+def get_cached_claims(kind, identity_id):
+    """读取缓存的身份声明，未命中返回None"""
+    redis_ttl, local_ttl = _ttls()
+    key = claims_key(kind, identity_id)
+
+    if local_ttl > 0:
+        entry = _local_cache.get(key)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+
+    if redis_ttl <= 0:
+        return None
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return None
+    try:
+        cached = redis_client.hgetall(key)
+    except Exception as e:
+        logger.warning(f"读取身份声明缓存失败 ({key}): {e}")
+        return None
+    if not cached:
+        return None
+
+    claims = {'id': int(cached['id']), 'is_admin': cached.get('is_admin') == '1'}
+    _store_local(key, claims, local_ttl)
+    return claims
+
+
+def cache_claims(kind, claims):
+    """写入身份声明缓存"""
+    redis_ttl, local_ttl = _ttls()
+    key = claims_key(kind, claims['id'])
+    _store_local(key, claims, local_ttl)
+
+    if redis_ttl <= 0:
+        return
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(key, mapping={'id': claims['id'], 'is_admin': int(bool(claims['is_admin']))})
+        pipe.expire(key, redis_ttl)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"写入身份声明缓存失败 ({key}): {e}")
+
+
+def invalidate_identity_claims(kind, identity_id):
+    """身份信息变更后清除缓存，其他进程的进程内缓存最多延迟 AUTH_CLAIMS_LOCAL_TTL 秒失效"""
+    key = claims_key(kind, identity_id)
+    with _local_lock:
+        _local_cache.pop(key, None)
+
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return
+    try:
+        redis_client.delete(key)
+    except Exception as e:
+        logger.warning(f"清除身份声明缓存失败 ({key}): {e}")
+
+
+def _store_local(key, claims, local_ttl):
+    if local_ttl <= 0:
+        return
+    with _local_lock:
+        if len(_local_cache) >= LOCAL_CACHE_MAX:
+            now = time.time()
+            for k in [k for k, (expires_at, _) in _local_cache.items() if expires_at <= now]:
+                del _local_cache[k]
+            if len(_local_cache) >= LOCAL_CACHE_MAX:
+                _local_cache.clear()
+        _local_cache[key] = (time.time() + local_ttl, claims)
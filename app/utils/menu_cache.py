@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/26 21:48
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : menu_cache.py
+# @Software: PyCharm
+
+# ==============================
+# 餐馆菜单版本与缓存
+# ==============================
+# menu:version:{restaurant_id}  菜单版本号，任何菜单变更都会递增，用于生成ETag
+# menu:full:{restaurant_id}     hash，version + 序列化好的完整菜单JSON
+import json
+import logging
+import time
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy.orm import selectinload
+
+from extensions.redis_sync import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+MENU_CACHE_TTL = 3600  # 缓存1小时，菜单变更时主动失效
+
+
+def menu_version_key(restaurant_id):
+    return f"menu:version:{restaurant_id}"
+
+
+def menu_cache_key(restaurant_id):
+    return f"menu:full:{restaurant_id}"
+
+
+def get_menu_version(restaurant_id):
+    """获取菜单版本号，Redis不可用时返回None"""
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return None
+    try:
+        version = redis_client.get(menu_version_key(restaurant_id))
+        if version is None:
+            # 以毫秒时间戳初始化，Redis数据丢失后版本号也不会回退到旧值
+            redis_client.set(menu_version_key(restaurant_id), int(time.time() * 1000), nx=True)
+            version = redis_client.get(menu_version_key(restaurant_id))
+        return version
+    except Exception as e:
+        logger.warning(f"读取菜单版本失败 (restaurant_id={restaurant_id}): {e}")
+        return None
+
+
+def bump_menu_version(restaurant_id):
+    """菜单（分类、菜品、选项组、选项）发生变更时调用：递增版本号并清除缓存"""
+    if not restaurant_id:
+        return
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.set(menu_version_key(restaurant_id), int(time.time() * 1000), nx=True)
+        pipe.incr(menu_version_key(restaurant_id))
+        pipe.delete(menu_cache_key(restaurant_id))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"更新菜单版本失败 (restaurant_id={restaurant_id}): {e}")
+
+
+def menu_etag(restaurant_id, version):
+    return f"menu-{restaurant_id}-{version}"
+
+
+def menu_conditional_get(fn):
+    """
+    菜单GET接口的条件请求装饰器
+
+    根据菜单版本号生成ETag，客户端 If-None-Match 命中时直接返回304，不访问MySQL也不做序列化。
+    被装饰的方法第一个参数须为 restaurant_id。
+    """
+    @wraps(fn)
+    def wrapper(self, restaurant_id, *args, **kwargs):
+        version = get_menu_version(restaurant_id)
+        if version is None:
+            return fn(self, restaurant_id, *args, **kwargs)
+
+        etag = menu_etag(restaurant_id, version)
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        rv = fn(self, restaurant_id, *args, **kwargs)
+        if isinstance(rv, current_app.response_class):
+            rv.set_etag(etag)
+            rv.headers['Cache-Control'] = 'no-cache'
+            return rv
+        data, code = rv[0], rv[1]
+        return data, code, {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+
+    return wrapper
+
+
+def build_menu_tree(restaurant_id):
+    """
+    构建餐馆完整菜单
+
+    分类、菜品、选项组、选项共4条查询，查询次数与菜品数量无关。
+    """
+    from app.models import MenuCategory, MenuItem, MenuOptionGroup, MenuOption
+
+    categories = MenuCategory.query.filter_by(
+        restaurant_id=restaurant_id, deleted=False
+    ).order_by(MenuCategory.display_order, MenuCategory.id).all()
+
+    items = MenuItem.query.filter_by(
+        restaurant_id=restaurant_id, deleted=False
+    ).options(
+        selectinload(MenuItem.option_groups.and_(MenuOptionGroup.deleted == False))
+        .selectinload(MenuOptionGroup.options.and_(MenuOption.deleted == False))
+    ).order_by(MenuItem.id).all()
+
+    category_nodes = {}
+    for category in categories:
+        node = category.to_dict()
+        node['display_order'] = category.display_order
+        node['items'] = []
+        category_nodes[category.id] = node
+
+    uncategorized = []
+    for item in items:
+        item_node = item.to_dict()
+        item_node['image'] = item.image
+        item_node['preparation_time'] = item.preparation_time
+        item_node['option_groups'] = []
+        for group in item.option_groups:
+            group_node = group.to_dict()
+            group_node['options'] = [option.to_dict() for option in group.options]
+            item_node['option_groups'].append(group_node)
+
+        # 分类已删除或未分类的菜品单独归组
+        category_node = category_nodes.get(item.category_id)
+        if category_node is not None:
+            category_node['items'].append(item_node)
+        else:
+            uncategorized.append(item_node)
+
+    return {
+        'restaurant_id': restaurant_id,
+        'categories': list(category_nodes.values()),
+        'uncategorized': uncategorized,
+    }
+
+
+def get_cached_menu(restaurant_id, version):
+    """读取指定版本的菜单JSON，未命中或版本不一致返回None"""
+    redis_client = get_redis_client()
+    if redis_client is None or version is None:
+        return None
+    try:
+        cached_version, payload = redis_client.hmget(menu_cache_key(restaurant_id), 'version', 'payload')
+    except Exception as e:
+        logger.warning(f"读取菜单缓存失败 (restaurant_id={restaurant_id}): {e}")
+        return None
+    return payload if cached_version == str(version) else None
+
+
+def cache_menu(restaurant_id, version, tree):
+    """序列化菜单并按版本写入缓存，返回JSON字符串"""
+    payload = json.dumps(tree)
+    redis_client = get_redis_client()
+    if redis_client is not None and version is not None:
+        try:
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.hset(menu_cache_key(restaurant_id), mapping={'version': version, 'payload': payload})
+            pipe.expire(menu_cache_key(restaurant_id), MENU_CACHE_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"写入菜单缓存失败 (restaurant_id={restaurant_id}): {e}")
+    return payload
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/28 21:12
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : metrics.py
+# @Software: PyCharm
+
+# ==============================
+# Prometheus 指标
+# ==============================
+# HTTP请求耗时/并发、每个请求的SQL次数与耗时、Redis命令耗时、Celery任务耗时。
+# 多进程部署（gunicorn多worker、celery prefork）时需在启动前设置环境变量 PROMETHEUS_MULTIPROC_DIR
+# 并清空该目录，各进程把指标写入目录下的mmap文件，由 /metrics 汇总输出。
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'HTTP请求耗时', ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', '正在处理的HTTP请求数', ['method'], multiprocess_mode='livesum'
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', '每个HTTP请求执行的SQL条数', ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    'db_time_per_request_seconds', '每个HTTP请求的SQL总耗时', ['route'], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', '单条SQL耗时', ['operation'], buckets=LATENCY_BUCKETS
+)
+REDIS_COMMAND_DURATION = Histogram(
+    'redis_command_duration_seconds', 'Redis命令耗时', ['command'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+REDIS_COMMAND_ERRORS = Counter('redis_command_errors_total', 'Redis命令异常次数', ['command'])
+CELERY_TASK_DURATION = Histogram(
+    'celery_task_duration_seconds', 'Celery任务耗时', ['task', 'state'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800)
+)
+
+
+def metrics_registry():
+    """多进程模式下汇总所有进程的指标，否则使用默认注册表"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    from prometheus_client import REGISTRY
+    return REGISTRY
+
+
+def metrics_response():
+    return Response(generate_latest(metrics_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+# ---------- SQLAlchemy ----------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+    DB_QUERY_DURATION.labels(operation).observe(elapsed)
+
+    # 在请求上下文中时累计到当前请求
+    stats = g.get('_db_stats') if has_request_context() else None
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def instrument_sqlalchemy():
+    """监听所有Engine的SQL执行（重复调用无副作用）"""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+# ---------- Redis ----------
+
+def instrument_redis(client):
+    """为Redis客户端实例的单条命令和pipeline记录耗时，返回同一个客户端"""
+    if client is None or getattr(client, '_metrics_instrumented', False):
+        return client
+
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def timed_execute_command(*args, **options):
+        command = str(args[0]).upper() if args else 'UNKNOWN'
+        start = time.perf_counter()
+        try:
+            return execute_command(*args, **options)
+        except Exception:
+            REDIS_COMMAND_ERRORS.labels(command).inc()
+            raise
+        finally:
+            REDIS_COMMAND_DURATION.labels(command).observe(time.perf_counter() - start)
+
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def timed_execute(*exec_args, **exec_kwargs):
+            start = time.perf_counter()
+            try:
+                return execute(*exec_args, **exec_kwargs)
+            except Exception:
+                REDIS_COMMAND_ERRORS.labels('PIPELINE').inc()
+                raise
+            finally:
+                REDIS_COMMAND_DURATION.labels('PIPELINE').observe(time.perf_counter() - start)
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_execute_command
+    client.pipeline = timed_pipeline
+    client._metrics_instrumented = True
+    return client
+
+
+# ---------- Celery ----------
+
+def instrument_celery(metrics_port=None):
+    """
+    记录Celery任务耗时，state为任务结束状态（SUCCESS/FAILURE/RETRY等）
+
+    metrics_port 不为空时，worker主进程在该端口暴露指标；prefork子进程的指标通过 PROMETHEUS_MULTIPROC_DIR 汇总。
+    """
+    from celery.signals import task_prerun, task_postrun, worker_init, worker_process_shutdown
+
+    started = {}
+
+    @task_prerun.connect(weak=False)
+    def _task_prerun(task_id=None, **kwargs):
+        started[task_id] = time.perf_counter()
+
+    @task_postrun.connect(weak=False)
+    def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+        start = started.pop(task_id, None)
+        if start is not None:
+            CELERY_TASK_DURATION.labels(getattr(task, 'name', 'unknown'), state or 'UNKNOWN').observe(
+                time.perf_counter() - start
+            )
+
+    if metrics_port:
+        @worker_init.connect(weak=False)
+        def _start_metrics_server(**kwargs):
+            from prometheus_client import start_http_server
+            start_http_server(int(metrics_port), registry=metrics_registry())
+
+    @worker_process_shutdown.connect(weak=False)
+    def _mark_process_dead(pid=None, **kwargs):
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            multiprocess.mark_process_dead(pid or os.getpid())
+
+
+# ---------- Flask ----------
+
+def _route_label():
+    # 使用路由模板而不是实际路径，避免标签基数随ID增长
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def init_metrics(app):
+    """注册请求指标中间件和 /metrics 接口"""
+    instrument_sqlalchemy()
+
+    from extensions import redis_sync
+    instrument_redis(redis_sync.redis_client)
+
+    @app.before_request
+    def start_metrics():
+        g._metrics_started = time.perf_counter()
+        g._db_stats = [0, 0.0]
+        HTTP_REQUESTS_IN_FLIGHT.labels(request.method).inc()
+
+    @app.after_request
+    def record_metrics(response):
+        started = g.get('_metrics_started')
+        if started is not None:
+            route = _route_label()
+            HTTP_REQUEST_DURATION.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - started
+            )
+            count, elapsed = g._db_stats
+            DB_QUERIES_PER_REQUEST.labels(route).observe(count)
+            DB_TIME_PER_REQUEST.labels(route).observe(elapsed)
+        return response
+
+    @app.teardown_request
+    def finish_metrics(exc=None):
+        # teardown 总会执行，保证异常请求也能减少并发计数
+        if g.pop('_metrics_started', None) is not None:
+            HTTP_REQUESTS_IN_FLIGHT.labels(request.method).dec()
+
+    app.add_url_rule('/metrics', 'metrics', metrics_response)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/10/4 11:05
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : order_state.py
+# @Software: PyCharm
+
+# ==============================
+# 订单状态机（乐观并发）
+# ==============================
+# 状态变更使用条件更新：UPDATE orders SET status=?, version=version+1 WHERE id=? AND version=?
+# 影响行数为0说明订单已被其他请求修改，回滚后读取最新状态重新校验并重试，不持有行锁或表锁。
+# 批处理（如支付回调）在一个事务中变更多笔订单，使用 apply_transition：冲突时不回滚，
+# 抛出 OrderVersionConflict，由调用方回滚整批后重试。
+import logging
+import random
+import time
+
+from app import db
+from app.utils.validation import BusinessValidationError
+from lib.ecode import ECode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_RETRIES = 3
+RETRY_BACKOFF = 0.01  # 重试基础退避（秒），按次数翻倍并加随机抖动
+
+
+class OrderVersionConflict(BusinessValidationError):
+    """订单在读取后被并发修改，条件更新未命中"""
+
+    def __init__(self, order_id):
+        super().__init__(f"Order {order_id} was modified concurrently", ECode.CONFLICT)
+        self.order_id = order_id
+
+
+def can_transition(old_status, new_status):
+    from app.models import Order
+
+    return new_status in Order.TRANSITIONS.get(old_status, ())
+
+
+def _update_status(order, new_status, actor=None, note=None, values=None):
+    """按版本号条件更新状态并记录状态历史，返回是否更新成功"""
+    from app.models import Order, OrderStatusHistory
+
+    result = db.session.execute(
+        db.update(Order).where(
+            Order.id == order.id,
+            Order.version == order.version
+        ).values(
+            status=new_status, version=Order.version + 1, **(values or {})
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+
+    db.session.add(OrderStatusHistory(
+        order_id=order.id,
+        status=new_status,
+        actor_id=getattr(actor, 'id', None),
+        actor_type=actor.__class__.__name__.lower() if actor is not None else 'system',
+        note=note or f"Status changed to {new_status}"
+    ))
+    # 条件更新绕过了ORM，重新加载订单的最新字段和版本号
+    db.session.expire(order)
+    return True
+
+
+def apply_transition(order, new_status, actor=None, note=None, values=None):
+    """
+    在当前事务中变更已加载订单的状态，不回滚、不重试，调用方负责提交
+
+    按 Order.TRANSITIONS 校验，不允许时抛出 BusinessValidationError；
+    订单已被并发修改时抛出 OrderVersionConflict，调用方应回滚后重新读取再处理。
+
+    Returns:
+        old_status
+    """
+    old_status = order.status
+    if not can_transition(old_status, new_status):
+        raise BusinessValidationError(
+            f"Cannot change order status from {old_status} to {new_status}", ECode.CONFLICT
+        )
+    if not _update_status(order, new_status, actor=actor, note=note, values=values):
+        raise OrderVersionConflict(order.id)
+    return old_status
+
+
+def transition_order(order_id, new_status, actor=None, note=None, values=None, allowed_from=None, check=None,
+                     max_retries=DEFAULT_MAX_RETRIES):
+    """
+    变更订单状态并记录状态历史，调用方负责提交事务
+
+    冲突重试时会回滚当前事务，调用前不要有未提交的修改；状态变更成功后再添加其他记录并提交。
+
+    Args:
+        actor: 操作人（用户、餐馆、骑手），记录到状态历史
+        values: 同时更新的其他字段，如 rider_id
+        allowed_from: 允许的原状态集合，不传时按 Order.TRANSITIONS 校验
+        check: check(order) 额外校验（如权限），每次重试都基于最新数据执行
+
+    Returns:
+        (order, old_status)
+    """
+    from app.models import Order
+
+    for attempt in range(max_retries + 1):
+        order = db.session.get(Order, order_id, populate_existing=True)
+        if order is None or order.deleted:
+            raise BusinessValidationError("Order not found", ECode.NOTFOUND)
+        if check is not None:
+            check(order)
+
+        old_status = order.status
+        allowed = old_status in allowed_from if allowed_from is not None else can_transition(old_status, new_status)
+        if not allowed:
+            raise BusinessValidationError(
+                f"Cannot change order status from {old_status} to {new_status}", ECode.CONFLICT
+            )
+
+        if _update_status(order, new_status, actor=actor, note=note, values=values):
+            return order, old_status
+
+        # 订单已被并发修改：结束当前事务，避免重复读到同一快照
+        db.session.rollback()
+        logger.info(f"订单状态并发冲突，重试 (order_id={order_id}, attempt={attempt + 1})")
+        if attempt < max_retries:
+            time.sleep(RETRY_BACKOFF * (2 ** attempt) * (1 + random.random()))
+
+    raise BusinessValidationError("Order was modified concurrently, please retry", ECode.CONFLICT)
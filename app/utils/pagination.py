@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/27 15:20
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : pagination.py
+# @Software: PyCharm
+
+from extensions.sqlalchemy_plus import CursorPaginator, CursorPageSchema
+from app.utils.validation import BusinessValidationError
+from lib.ecode import ECode
+
+
+def pagination_args(args):
+    """从请求参数中提取游标分页参数：cursor、per_page、with_total"""
+    try:
+        per_page = int(args.get('per_page') or 20)
+    except (TypeError, ValueError):
+        raise BusinessValidationError("Invalid per_page", ECode.PARAM)
+    with_total = str(args.get('with_total', '')).lower() in ('1', 'true', 'yes')
+    return {'cursor': args.get('cursor'), 'per_page': per_page, 'with_total': with_total}
+
+
+def cursor_paginate(query, model, cursor=None, per_page=20, with_total=False, serializer=None):
+    """
+    按 (created_at, id) 倒序做游标分页
+
+    Returns:
+        dict: {'items': [...], 'page': {'perPage', 'hasNext', 'nextCursor', 'total', 'totalIsEstimate'}}
+    """
+    try:
+        paginator = CursorPaginator(query, model, cursor, per_page, with_total)
+    except ValueError:
+        raise BusinessValidationError("Invalid cursor", ECode.PARAM)
+
+    content = paginator.render_page()
+    serializer = serializer or (lambda obj: obj.to_dict())
+    return {
+        'items': [serializer(item) for item in content.items],
+        'page': CursorPageSchema().dump(content.page),
+    }
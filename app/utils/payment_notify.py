@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/10/3 16:42
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : payment_notify.py
+# @Software: PyCharm
+
+# ==============================
+# 支付回调异步处理
+# ==============================
+# 回调接口只验签、去重、入队后立即应答，不访问数据库：
+# payment_notify:seen:{out_trade_no}:{transaction_id}  去重标记，微信重复通知时直接应答成功
+# payment_notify:queue                                 列表，待处理的回调
+# payment_notify:dead_letter                           列表，无法处理的回调及错误信息，待人工核对
+# 由 tasks.db_tasks.process_payment_notifications 定时批量取出，更新 Payment 和 Order 状态。
+import json
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_NOTIFY_QUEUE_KEY = 'payment_notify:queue'
+PAYMENT_NOTIFY_STATS_KEY = 'payment_notify:stats'
+PAYMENT_NOTIFY_DEAD_LETTER_KEY = 'payment_notify:dead_letter'
+NOTIFY_SEEN_TTL = 2 * 24 * 3600  # 微信在24小时内重复通知，去重标记保留2天
+
+# 入队时保留的回调字段
+NOTIFY_FIELDS = (
+    'out_trade_no', 'transaction_id', 'return_code', 'result_code', 'total_fee',
+    'time_end', 'bank_type', 'cash_fee', 'err_code', 'err_code_des',
+)
+
+
+def notify_seen_key(out_trade_no, transaction_id):
+    return f"payment_notify:seen:{out_trade_no}:{transaction_id or '-'}"
+
+
+def is_success(notification):
+    return notification.get('return_code') == 'SUCCESS' and notification.get('result_code') == 'SUCCESS'
+
+
+def enqueue_payment_notify(redis_client, notify_data):
+    """
+    回调去重后放入处理队列
+
+    Returns:
+        bool: 新回调入队返回True，重复回调返回False
+    """
+    notification = {field: notify_data.get(field) for field in NOTIFY_FIELDS}
+    notification['received_at'] = datetime.now().isoformat()
+
+    seen_key = notify_seen_key(notification['out_trade_no'], notification['transaction_id'])
+    if not redis_client.set(seen_key, 1, nx=True, ex=NOTIFY_SEEN_TTL):
+        return False
+    try:
+        redis_client.rpush(PAYMENT_NOTIFY_QUEUE_KEY, json.dumps(notification))
+    except Exception:
+        # 入队失败时撤销去重标记，让微信重试通知
+        redis_client.delete(seen_key)
+        raise
+    return True
+
+
+def _latest_by_trade_no(notifications):
+    """同一商户订单号的多条回调只保留一条，成功回调优先"""
+    latest = {}
+    for notification in notifications:
+        out_trade_no = notification.get('out_trade_no')
+        if not out_trade_no:
+            continue
+        previous = latest.get(out_trade_no)
+        if previous is None or is_success(notification) or not is_success(previous):
+            latest[out_trade_no] = notification
+    return latest
+
+
+def apply_payment_notifications(notifications):
+    """
+    批量应用支付回调：两条查询取出涉及的 Payment 和 Order 并更新，由调用方提交
+
+    已成功的支付不会被重复处理；支付成功时订单经状态机（apply_transition）变为已付款并记录状态历史，
+    订单已被并发修改时抛出 OrderVersionConflict，调用方回滚后重试。
+
+    Returns:
+        (stats, rejected): stats 为 applied / duplicates / missing / mismatched 计数；
+        rejected 为无法应用的回调 [(notification, reason)]（支付订单不存在、金额不一致），由调用方留存待人工核对
+    """
+    from app.models import Order
+    from app.models.payments import Payment
+    from app.utils.order_state import apply_transition, can_transition
+
+    stats = {'applied': 0, 'duplicates': 0, 'missing': 0, 'mismatched': 0}
+    rejected = []
+    latest = _latest_by_trade_no(notifications)
+    if not latest:
+        return stats, rejected
+
+    payments = Payment.query.filter(Payment.out_trade_no.in_(list(latest))).all()
+    order_ids = {payment.order_id for payment in payments if payment.order_id}
+    orders = {order.id: order for order in Order.query.filter(Order.id.in_(order_ids)).all()} if order_ids else {}
+
+    stats['missing'] = len(latest) - len(payments)
+    if stats['missing']:
+        found = {payment.out_trade_no for payment in payments}
+        logger.error(f"支付订单不存在: {sorted(set(latest) - found)}")
+        rejected.extend(
+            (notification, 'missing: payment not found')
+            for out_trade_no, notification in latest.items() if out_trade_no not in found
+        )
+
+    for payment in payments:
+        notification = latest[payment.out_trade_no]
+        if payment.status == 'SUCCESS':
+            stats['duplicates'] += 1
+            continue
+
+        if is_success(notification):
+            if str(notification.get('total_fee')) != str(payment.total_fee):
+                logger.error(
+                    f"支付金额不一致: {payment.out_trade_no}, 回调 {notification.get('total_fee')}, 订单 {payment.total_fee}"
+                )
+                stats['mismatched'] += 1
+                rejected.append((
+                    notification,
+                    f"mismatched: notify total_fee {notification.get('total_fee')}, payment {payment.total_fee}"
+                ))
+                continue
+
+            payment.status = 'SUCCESS'
+            payment.transaction_id = notification.get('transaction_id')
+            payment.time_end = notification.get('time_end')
+            payment.bank_type = notification.get('bank_type')
+            payment.cash_fee = notification.get('cash_fee')
+
+            order = orders.get(payment.order_id)
+            if order is not None and can_transition(order.status, Order.STATUS_PAID):
+                apply_transition(order, Order.STATUS_PAID, note=f"WeChat pay {payment.transaction_id}")
+            elif order is not None:
+                logger.warning(f"支付成功但订单状态为 {order.status}，未变更 (order_id={order.id})")
+            logger.info(f"支付成功: {payment.out_trade_no}, 金额: {notification.get('total_fee')}")
+        else:
+            payment.status = 'FAIL'
+            payment.err_code = notification.get('err_code')
+            payment.err_code_des = notification.get('err_code_des')
+            logger.error(f"支付失败: {payment.out_trade_no}, 错误: {notification.get('err_code_des')}")
+        stats['applied'] += 1
+
+    return stats, rejected
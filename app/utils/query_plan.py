@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/27 22:40
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : query_plan.py
+# @Software: PyCharm
+
+# ==============================
+# 执行计划检查
+# ==============================
+# 对热点查询执行 EXPLAIN，发现全表扫描时报告失败，防止索引被误删或查询条件改动后失效。
+# 运行：flask explain-check（存在全表扫描时退出码为1）
+import logging
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def explain(statement, session=None):
+    """
+    对SQLAlchemy语句执行EXPLAIN
+
+    Returns:
+        list[dict]: 执行计划行（MySQL为EXPLAIN输出，SQLite为EXPLAIN QUERY PLAN输出）
+    """
+    session = session or db.session
+    connection = session.connection()
+
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return explain_sql(connection, str(compiled), params)
+
+
+def explain_sql(connection, sql, params=None):
+    """对已编译的SQL字符串（DBAPI参数格式）执行EXPLAIN"""
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+    result = connection.exec_driver_sql(prefix + sql, params if params is not None else ())
+    return [dict(row) for row in result.mappings().all()]
+
+
+def full_scan_tables(plan, dialect_name):
+    """从执行计划中找出被全表扫描的表"""
+    tables = set()
+    for row in plan:
+        if dialect_name == 'sqlite':
+            detail = row.get('detail', '')
+            # "SCAN orders" 为全表扫描，"SCAN orders USING [COVERING] INDEX ..." 为索引扫描
+            if detail.startswith('SCAN ') and ' USING ' not in detail:
+                tables.add(detail.split()[1])
+        elif row.get('type') == 'ALL':
+            tables.add(row.get('table'))
+    return tables
+
+
+def hot_queries():
+    """
+    热点查询及需要走索引的表
+
+    查询条件与实体类中的真实查询保持一致，新增热点查询时在此登记。
+    """
+    from app.models import Order, RiderAssignment, UserCoupon, Rider, RiderLocation, Coupon, User
+
+    def page(model, *criteria):
+        return db.select(model).where(*criteria).order_by(model.created_at.desc(), model.id.desc()).limit(21)
+
+    return [
+        ('user_orders_page', 'orders', page(Order, Order.deleted == False, Order.user_id == 1)),
+        ('admin_orders_page', 'orders', page(Order, Order.deleted == False)),
+        ('restaurant_orders_by_status', 'orders', db.select(Order).where(
+            Order.restaurant_id == 1, Order.status == Order.STATUS_COMPLETED)),
+        ('rider_orders_by_status', 'orders', db.select(Order).where(
+            Order.rider_id == 1, Order.status == Order.STATUS_DELIVERING)),
+        ('rider_order_loads', 'rider_assignments', db.select(
+            RiderAssignment.rider_id, db.func.count(RiderAssignment.id)
+        ).join(Order, Order.id == RiderAssignment.order_id).where(
+            RiderAssignment.rider_id.in_([1, 2, 3]),
+            RiderAssignment.status == RiderAssignment.STATUS_ACCEPTED,
+        ).group_by(RiderAssignment.rider_id)),
+        ('user_coupon_lookup', 'user_coupons', db.select(UserCoupon).where(
+            UserCoupon.user_id == 1, UserCoupon.coupon_id == 1, UserCoupon.status == UserCoupon.STATUS_UNUSED)),
+        ('unused_user_coupons', 'user_coupons', db.select(UserCoupon.id).where(
+            UserCoupon.status == UserCoupon.STATUS_UNUSED, UserCoupon.coupon_id.in_([1, 2, 3]))),
+        ('available_riders', 'riders', db.select(Rider).where(
+            Rider.is_online == True, Rider.is_available == True, Rider.deleted == False)),
+        ('riders_page', 'riders', page(Rider, Rider.deleted == False)),
+        ('rider_location_history', 'rider_locations', db.select(RiderLocation).where(
+            RiderLocation.rider_id == 1).order_by(RiderLocation.timestamp.desc()).limit(50)),
+        ('coupons_page', 'coupons', page(Coupon, Coupon.deleted == False)),
+        ('users_page', 'users', db.select(User).order_by(User.created_at.desc(), User.id.desc()).limit(21)),
+    ]
+
+
+def check_hot_queries(session=None):
+    """
+    检查所有热点查询的执行计划
+
+    Returns:
+        list: 出现全表扫描的 (查询名, 表名, 执行计划)，为空表示全部走索引
+    """
+    session = session or db.session
+    dialect_name = session.connection().dialect.name
+
+    failures = []
+    for name, table, statement in hot_queries():
+        plan = explain(statement, session)
+        if table in full_scan_tables(plan, dialect_name):
+            logger.error(f"热点查询 {name} 对 {table} 全表扫描: {plan}")
+            failures.append((name, table, plan))
+        else:
+            logger.info(f"热点查询 {name} 执行计划正常")
+    return failures
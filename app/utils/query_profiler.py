@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/29 20:47
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : query_profiler.py
+# @Software: PyCharm
+
+# ==============================
+# SQL 性能分析（开发/预发环境）
+# ==============================
+# 统计每个请求执行的SQL：
+#   - 同一语句结构重复执行超过 QUERY_PROFILER_REPEAT_THRESHOLD 次时按疑似 N+1 告警
+#   - 超过 QUERY_PROFILER_SLOW_MS 的 SELECT 在请求结束后执行 EXPLAIN 并记录执行计划
+#   - 响应头 Server-Timing 返回 SQL 条数、SQL 总耗时和请求总耗时，可在浏览器开发者工具中查看
+# 通过 QUERY_PROFILER_ENABLED 开启，生产环境不要开启。
+import logging
+import re
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('app.query_profiler')
+
+DEFAULT_SLOW_MS = 100
+DEFAULT_REPEAT_THRESHOLD = 5
+MAX_EXPLAIN_PER_REQUEST = 10  # 单个请求最多EXPLAIN的慢SQL条数
+
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """语句结构：合并空白，IN 列表折叠为单个占位符"""
+    return _IN_LIST.sub('(?)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class RequestQueryProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}  # 语句结构 -> [次数, 总耗时]
+        self.slow = []  # (耗时, 语句, 参数)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profiler_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('profiler_start_time')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    profile = g.get('_query_profile') if has_request_context() else None
+    if profile is None or g.get('_query_profile_explaining'):
+        return
+
+    profile.count += 1
+    profile.duration += elapsed
+    stats = profile.shapes.setdefault(statement_shape(statement), [0, 0.0])
+    stats[0] += 1
+    stats[1] += elapsed
+    if not executemany and elapsed * 1000 >= profile.slow_ms and len(profile.slow) < MAX_EXPLAIN_PER_REQUEST:
+        profile.slow.append((elapsed, statement, parameters))
+
+
+def _explain_slow_queries(profile):
+    from app import db
+    from app.utils.query_plan import explain_sql
+
+    g._query_profile_explaining = True
+    try:
+        with db.engine.connect() as connection:
+            for elapsed, statement, parameters in profile.slow:
+                if not statement.lstrip().upper().startswith('SELECT'):
+                    logger.warning(f"慢SQL {elapsed * 1000:.1f}ms: {statement}")
+                    continue
+                try:
+                    plan = explain_sql(connection, statement, parameters)
+                except Exception as e:
+                    plan = f"EXPLAIN失败: {e}"
+                logger.warning(f"慢SQL {elapsed * 1000:.1f}ms: {statement} 参数: {parameters} 执行计划: {plan}")
+    finally:
+        g._query_profile_explaining = False
+
+
+def init_query_profiler(app):
+    """注册SQL性能分析中间件"""
+    slow_ms = float(app.config.get('QUERY_PROFILER_SLOW_MS', DEFAULT_SLOW_MS))
+    repeat_threshold = int(app.config.get('QUERY_PROFILER_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD))
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_query_profile():
+        profile = RequestQueryProfile()
+        profile.slow_ms = slow_ms
+        g._query_profile = profile
+
+    @app.after_request
+    def finish_query_profile(response):
+        profile = g.pop('_query_profile', None)
+        if profile is None:
+            return response
+
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={profile.duration * 1000:.1f};desc="{profile.count} queries", app;dur={total_ms:.1f}'
+        )
+
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        for shape, (count, duration) in profile.shapes.items():
+            if count >= repeat_threshold:
+                logger.warning(
+                    f"疑似N+1查询 {request.method} {route}: 同一语句执行 {count} 次，"
+                    f"共 {duration * 1000:.1f}ms: {shape}"
+                )
+        if profile.slow:
+            _explain_slow_queries(profile)
+        return response
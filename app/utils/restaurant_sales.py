@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/10/1 11:18
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : restaurant_sales.py
+# @Software: PyCharm
+
+# ==============================
+# 餐馆销售额（Redis）
+# ==============================
+# restaurant_sales:{restaurant_id}             累计销售额
+# restaurant_sales:{restaurant_id}:{YYYYMMDD}  当日销售额，保留 DAILY_SALES_TTL
+# restaurant_sales:versions                    hash，餐馆ID -> 增量累加次数
+# 订单变为已完成时由 record_completed_order 增量累加；
+# tasks.db_tasks.update_restaurant_sales 定时用一次 GROUP BY 全量校准，修正增量过程中可能出现的偏差。
+#
+# 校准时 GROUP BY 与写入之间有时间差，期间到达的增量会被旧快照的 SET 覆盖。
+# 因此每次增量同时递增该餐馆的版本号，校准在查询前记下版本号，写入时 WATCH 版本 hash，
+# 只覆盖版本未变化的餐馆；版本变化的餐馆本次跳过，保留增量值，由下次校准处理。
+import logging
+from datetime import date, datetime, time as dt_time
+
+from redis.exceptions import WatchError
+
+from extensions.redis_sync import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+DAILY_SALES_TTL = 40 * 24 * 3600  # 当日销售额保留40天
+SALES_VERSION_KEY = 'restaurant_sales:versions'
+REBUILD_WATCH_RETRIES = 3
+
+
+def sales_key(restaurant_id):
+    return f"restaurant_sales:{restaurant_id}"
+
+
+def daily_sales_key(restaurant_id, day):
+    return f"restaurant_sales:{restaurant_id}:{day.strftime('%Y%m%d')}"
+
+
+def record_completed_order(order, redis_client=None):
+    """订单完成时累加餐馆的累计和当日销售额"""
+    redis_client = redis_client or get_redis_client()
+    if redis_client is None:
+        logger.warning(f"Redis客户端未初始化，订单 {order.id} 销售额等待定时校准")
+        return
+
+    amount = float(order.final_amount or 0)
+    daily_key = daily_sales_key(order.restaurant_id, date.today())
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.incrbyfloat(sales_key(order.restaurant_id), amount)
+        pipe.incrbyfloat(daily_key, amount)
+        pipe.expire(daily_key, DAILY_SALES_TTL)
+        pipe.hincrby(SALES_VERSION_KEY, order.restaurant_id, 1)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"累加餐馆销售额失败 (order_id={order.id}): {e}")
+
+
+def rebuild_restaurant_sales(redis_client, day=None):
+    """
+    全量校准销售额：累计销售额和指定日期（默认今天）的当日销售额各一次 GROUP BY，一个pipeline写入
+
+    当日销售额按订单变为已完成的时间（OrderStatusHistory）统计。
+    查询期间有新增量的餐馆本次不覆盖（见模块说明）。
+
+    Returns:
+        int: 写入的餐馆数
+    """
+    from app import db
+    from app.models import Order, OrderStatusHistory, Restaurant
+
+    day = day or date.today()
+    # 结束当前事务，保证下面的查询快照晚于版本号的读取
+    db.session.commit()
+    versions_before = redis_client.hgetall(SALES_VERSION_KEY)
+
+    totals = dict(db.session.query(
+        Order.restaurant_id, db.func.sum(Order.final_amount)
+    ).filter(
+        Order.status == Order.STATUS_COMPLETED
+    ).group_by(Order.restaurant_id).all())
+
+    completed_today = db.select(
+        OrderStatusHistory.order_id
+    ).where(
+        OrderStatusHistory.status == Order.STATUS_COMPLETED,
+        OrderStatusHistory.created_at >= datetime.combine(day, dt_time.min),
+        OrderStatusHistory.created_at <= datetime.combine(day, dt_time.max),
+    ).distinct()
+    daily = dict(db.session.query(
+        Order.restaurant_id, db.func.sum(Order.final_amount)
+    ).filter(
+        Order.status == Order.STATUS_COMPLETED,
+        Order.id.in_(completed_today)
+    ).group_by(Order.restaurant_id).all())
+
+    restaurant_ids = [rid for (rid,) in db.session.query(Restaurant.id).all()]
+    for _ in range(REBUILD_WATCH_RETRIES):
+        with redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(SALES_VERSION_KEY)
+                versions_now = pipe.hgetall(SALES_VERSION_KEY)
+                stable_ids = [
+                    rid for rid in restaurant_ids
+                    if versions_now.get(str(rid)) == versions_before.get(str(rid))
+                ]
+                pipe.multi()
+                for restaurant_id in stable_ids:
+                    pipe.set(sales_key(restaurant_id), float(totals.get(restaurant_id) or 0))
+                    pipe.set(daily_sales_key(restaurant_id, day), float(daily.get(restaurant_id) or 0),
+                             ex=DAILY_SALES_TTL)
+                pipe.execute()
+            except WatchError:
+                continue
+        skipped = len(restaurant_ids) - len(stable_ids)
+        if skipped:
+            logger.info(f"{skipped} 家餐馆在校准期间有新增销售额，本次跳过")
+        return len(stable_ids)
+
+    logger.warning("校准期间销售额持续变化，本次未写入，等待下次校准")
+    return 0
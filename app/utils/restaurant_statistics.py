@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/10/2 10:36
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : restaurant_statistics.py
+# @Software: PyCharm
+
+# ==============================
+# 餐馆每日统计汇总
+# ==============================
+# 按自然日把订单、评价、订单项汇总到 restaurant_statistics，每天每个餐馆一行。
+# 每天只需3条 GROUP BY 查询，与餐馆数量无关；同一天重复执行会覆盖旧结果，可按日期区间回填。
+import json
+import logging
+from datetime import datetime, time as dt_time, timedelta
+
+logger = logging.getLogger(__name__)
+
+POPULAR_ITEMS_LIMIT = 10  # 每个餐馆保留的热门菜品数
+
+
+def _day_range(day):
+    start = datetime.combine(day, dt_time.min)
+    return start, start + timedelta(days=1)
+
+
+def _order_totals(day):
+    """订单数、完成数、取消数、营业额"""
+    from app import db
+    from app.models import Order
+
+    start, end = _day_range(day)
+    completed = db.case((Order.status == Order.STATUS_COMPLETED, 1), else_=0)
+    canceled = db.case((Order.status == Order.STATUS_CANCELED, 1), else_=0)
+    revenue = db.case((Order.status == Order.STATUS_COMPLETED, Order.final_amount), else_=0)
+
+    rows = db.session.query(
+        Order.restaurant_id,
+        db.func.count(Order.id),
+        db.func.sum(completed),
+        db.func.sum(canceled),
+        db.func.sum(revenue),
+    ).filter(
+        Order.created_at >= start,
+        Order.created_at < end,
+        Order.deleted == False
+    ).group_by(Order.restaurant_id).all()
+
+    return {
+        restaurant_id: (int(total or 0), int(completed_count or 0), int(canceled_count or 0), float(amount or 0))
+        for restaurant_id, total, completed_count, canceled_count, amount in rows
+    }
+
+
+def _average_ratings(day):
+    """当天评价的平均分"""
+    from app import db
+    from app.models import Review
+
+    start, end = _day_range(day)
+    rows = db.session.query(
+        Review.restaurant_id, db.func.avg(Review.rating)
+    ).filter(
+        Review.created_at >= start,
+        Review.created_at < end,
+        Review.deleted == False
+    ).group_by(Review.restaurant_id).all()
+    return {restaurant_id: round(float(rating), 2) for restaurant_id, rating in rows if rating is not None}
+
+
+def _popular_items(day, limit=POPULAR_ITEMS_LIMIT):
+    """按销量汇总当天未取消订单的菜品，每个餐馆取前 limit 个"""
+    from app import db
+    from app.models import Order, OrderItem, MenuItem
+
+    start, end = _day_range(day)
+    quantity = db.func.sum(OrderItem.quantity)
+    rows = db.session.query(
+        Order.restaurant_id,
+        OrderItem.menu_item_id,
+        MenuItem.name,
+        quantity,
+        db.func.sum(OrderItem.quantity * OrderItem.price_at_order),
+    ).join(
+        Order, OrderItem.order_id == Order.id
+    ).join(
+        MenuItem, OrderItem.menu_item_id == MenuItem.id
+    ).filter(
+        Order.created_at >= start,
+        Order.created_at < end,
+        Order.deleted == False,
+        Order.status != Order.STATUS_CANCELED
+    ).group_by(
+        Order.restaurant_id, OrderItem.menu_item_id, MenuItem.name
+    ).order_by(
+        Order.restaurant_id, quantity.desc(), OrderItem.menu_item_id
+    ).all()
+
+    items = {}
+    for restaurant_id, menu_item_id, name, item_quantity, item_revenue in rows:
+        ranked = items.setdefault(restaurant_id, [])
+        if len(ranked) < limit:
+            ranked.append({
+                'menu_item_id': menu_item_id,
+                'name': name,
+                'quantity': int(item_quantity or 0),
+                'revenue': round(float(item_revenue or 0), 2),
+            })
+    return items
+
+
+def rollup_restaurant_statistics(day):
+    """
+    汇总指定日期所有餐馆的统计数据
+
+    先删除当天已有的统计行再整批插入，在同一事务中提交，重复执行结果一致。
+    当天没有订单的餐馆也会写入一行0值统计。
+
+    Returns:
+        int: 写入的统计行数
+    """
+    from app import db
+    from app.models import Restaurant, RestaurantStatistics
+
+    totals = _order_totals(day)
+    ratings = _average_ratings(day)
+    popular = _popular_items(day)
+
+    # 已删除餐馆当天仍有订单时也保留统计
+    restaurant_ids = {rid for (rid,) in db.session.query(Restaurant.id).filter(Restaurant.deleted == False).all()}
+    restaurant_ids.update(totals)
+
+    now = datetime.now()
+    rows = []
+    for restaurant_id in sorted(restaurant_ids):
+        total, completed, canceled, revenue = totals.get(restaurant_id, (0, 0, 0, 0.0))
+        rows.append({
+            'restaurant_id': restaurant_id,
+            'date': day,
+            'total_orders': total,
+            'completed_orders': completed,
+            'canceled_orders': canceled,
+            'total_revenue': round(revenue, 2),
+            'average_rating': ratings.get(restaurant_id, 0.0),
+            'popular_items': json.dumps(popular.get(restaurant_id, []), ensure_ascii=False),
+            'created_at': now,
+            'updated_at': now,
+            'deleted': False,
+        })
+
+    try:
+        db.session.execute(db.delete(RestaurantStatistics).where(RestaurantStatistics.date == day))
+        if rows:
+            db.session.execute(db.insert(RestaurantStatistics), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.info(f"餐馆统计汇总完成 date={day} rows={len(rows)}")
+    return len(rows)
+
+
+def rollup_date_range(start_date, end_date):
+    """按日期区间（含首尾）逐日汇总，用于回填历史统计"""
+    if end_date < start_date:
+        raise ValueError("end_date must not be earlier than start_date")
+
+    results = {}
+    day = start_date
+    while day <= end_date:
+        results[day.isoformat()] = rollup_restaurant_statistics(day)
+        day += timedelta(days=1)
+    return results
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/20 21:10
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : rider_geo.py
+# @Software: PyCharm
+
+# ==============================
+# 骑手派单空间索引（Redis GEO）
+# ==============================
+# rider_geo               GEO集合，member=骑手ID，保存骑手最新坐标
+# rider_dispatch:available 可接单骑手ID集合（在线且可接单）
+# rider_dispatch:radius    骑手最大配送距离（米），hash: 骑手ID -> 半径
+# Redis 不可用时从数据库取可接单骑手的最近定位，用 app.utils.geo 的批量距离接口筛选。
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.utils.geo import points_within_radius
+from extensions.redis_sync import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+RIDER_GEO_KEY = 'rider_geo'
+RIDER_AVAILABLE_KEY = 'rider_dispatch:available'
+RIDER_RADIUS_KEY = 'rider_dispatch:radius'
+DB_FALLBACK_MAX_AGE = 600  # 数据库回退时只使用最近10分钟内的定位（秒）
+
+
+def update_rider_position(rider_id, latitude, longitude, pipe=None):
+    """写入骑手最新坐标到GEO索引，传入pipe时只入队不执行"""
+    client = pipe if pipe is not None else get_redis_client()
+    if client is None:
+        return False
+    client.geoadd(RIDER_GEO_KEY, (float(longitude), float(latitude), str(rider_id)))
+    return True
+
+
+def set_rider_dispatch_state(rider, pipe=None):
+    """根据骑手在线/可接单状态和配送半径同步派单索引"""
+    client = pipe if pipe is not None else get_redis_client()
+    if client is None:
+        return False
+
+    rider_id = str(rider.id)
+    if rider.is_online and rider.is_available and not rider.deleted:
+        client.sadd(RIDER_AVAILABLE_KEY, rider_id)
+    else:
+        client.srem(RIDER_AVAILABLE_KEY, rider_id)
+
+    if rider.delivery_radius:
+        client.hset(RIDER_RADIUS_KEY, rider_id, rider.delivery_radius)
+    else:
+        client.hdel(RIDER_RADIUS_KEY, rider_id)
+
+    # 已删除的骑手同时移出坐标索引
+    if rider.deleted:
+        client.zrem(RIDER_GEO_KEY, rider_id)
+    return True
+
+
+def rebuild_rider_dispatch_state(riders):
+    """根据数据库中的骑手全量重建可接单集合与半径表（Redis重启后使用）"""
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return 0
+
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(RIDER_AVAILABLE_KEY, RIDER_RADIUS_KEY)
+    count = 0
+    for rider in riders:
+        set_rider_dispatch_state(rider, pipe=pipe)
+        count += 1
+    pipe.execute()
+    logger.info(f"骑手派单索引重建完成，共 {count} 名骑手")
+    return count
+
+
+def search_available_riders(lat, lon, radius=5000, limit=5):
+    """
+    查询半径内可接单的骑手，按距离升序返回
+
+    一次GEOSEARCH取出半径内的全部骑手，再用一次pipeline批量过滤可接单状态
+    和骑手自身的配送半径，派单过程不访问MySQL。
+
+    Returns:
+        list: [{'rider_id', 'distance', 'location': {'latitude', 'longitude'}}]
+    """
+    redis_client = get_redis_client()
+    if redis_client is None:
+        logger.warning("Redis client not available, search riders from database")
+        return search_available_riders_db(lat, lon, radius=radius, limit=limit)
+
+    try:
+        candidates = redis_client.geosearch(
+            RIDER_GEO_KEY,
+            longitude=lon,
+            latitude=lat,
+            radius=radius,
+            unit='m',
+            sort='ASC',
+            withdist=True,
+            withcoord=True,
+        )
+    except Exception as e:
+        logger.warning(f"Redis rider search failed, search riders from database: {e}")
+        return search_available_riders_db(lat, lon, radius=radius, limit=limit)
+    if not candidates:
+        return []
+
+    member_ids = [member for member, _, _ in candidates]
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.smismember(RIDER_AVAILABLE_KEY, member_ids)
+    pipe.hmget(RIDER_RADIUS_KEY, member_ids)
+    available_flags, radii = pipe.execute()
+
+    nearby_riders = []
+    for (member, distance, (rider_lon, rider_lat)), available, rider_radius in zip(
+            candidates, available_flags, radii):
+        if not available:
+            continue
+
+        # 检查是否在骑手自身的配送半径内
+        if rider_radius and distance > float(rider_radius):
+            continue
+
+        nearby_riders.append({
+            'rider_id': int(member),
+            'distance': distance,
+            'location': {
+                'latitude': rider_lat,
+                'longitude': rider_lon
+            }
+        })
+        if len(nearby_riders) >= limit:
+            break
+
+    return nearby_riders
+
+
+def search_available_riders_db(lat, lon, radius=5000, limit=5, max_age=DB_FALLBACK_MAX_AGE):
+    """
+    从数据库查询半径内可接单的骑手（Redis不可用时的回退），返回格式同 search_available_riders
+
+    一次查询取出所有可接单骑手在 max_age 秒内的最新定位，再用 points_within_radius
+    批量粗筛和计算距离，并按骑手自身的配送半径过滤。
+    """
+    from app import db
+    from app.models import Rider, RiderLocation
+
+    since = datetime.now() - timedelta(seconds=max_age)
+    latest_timestamp = db.select(db.func.max(RiderLocation.timestamp)).where(
+        RiderLocation.rider_id == Rider.id,
+        RiderLocation.timestamp >= since
+    ).correlate(Rider).scalar_subquery()
+    rows = db.session.query(
+        Rider.id, Rider.delivery_radius, RiderLocation.latitude, RiderLocation.longitude
+    ).join(
+        RiderLocation, db.and_(RiderLocation.rider_id == Rider.id, RiderLocation.timestamp == latest_timestamp)
+    ).filter(
+        Rider.is_online == True,
+        Rider.is_available == True,
+        Rider.deleted == False
+    ).all()
+
+    # 同一时间戳有多条定位时每个骑手只保留一条
+    riders = list({row.id: row for row in rows}.values())
+    if not riders:
+        return []
+
+    lats = np.fromiter((row.latitude for row in riders), dtype=np.float64, count=len(riders))
+    lons = np.fromiter((row.longitude for row in riders), dtype=np.float64, count=len(riders))
+    rider_radii = np.fromiter(
+        (row.delivery_radius or np.inf for row in riders), dtype=np.float64, count=len(riders)
+    )
+
+    indices, distances = points_within_radius(lat, lon, lats, lons, radius)
+    # 检查是否在骑手自身的配送半径内
+    within = distances <= rider_radii[indices]
+    indices, distances = indices[within][:limit], distances[within][:limit]
+
+    return [{
+        'rider_id': riders[i].id,
+        'distance': float(distance),
+        'location': {
+            'latitude': riders[i].latitude,
+            'longitude': riders[i].longitude
+        }
+    } for i, distance in zip(indices, distances)]
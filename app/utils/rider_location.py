@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/22 20:31
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : rider_location.py
+# @Software: PyCharm
+
+# ==============================
+# 骑手位置存储（Redis）
+# ==============================
+# rider_locations:{id}  有序集合，score=时间戳，member=位置JSON，按时间和条数裁剪
+# rider_latest:{id}     hash，骑手最新位置，O(1)读取
+# rider_location:buffer 列表，待批量写入 RiderLocation 表的定位缓冲
+# rider_location:dead_letter 列表，无法写入数据库的定位（如 order_id 不存在）
+import json
+import logging
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from app.utils.geo import haversine
+from app.utils.rider_geo import update_rider_position
+from extensions.redis_sync import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 6 * 3600  # 轨迹最多保留6小时
+DEFAULT_MAX_COUNT = 1000  # 每个骑手最多保留1000个点
+DEFAULT_BUFFER_MAX = 200000  # 落库缓冲上限，超出后丢弃最旧的定位
+DEFAULT_MIN_DISTANCE = 15  # 移动不足15米视为原地
+DEFAULT_MIN_INTERVAL = 3  # 两次定位最少间隔3秒
+DEFAULT_MAX_INTERVAL = 60  # 原地不动时至少每60秒保留一个点
+
+LOCATION_BUFFER_KEY = 'rider_location:buffer'
+LOCATION_FLUSH_STATS_KEY = 'rider_location:flush_stats'
+LOCATION_DEAD_LETTER_KEY = 'rider_location:dead_letter'
+
+
+def history_key(rider_id):
+    return f"rider_locations:{rider_id}"
+
+
+def latest_key(rider_id):
+    return f"rider_latest:{rider_id}"
+
+
+def _location_limits():
+    config = current_app.config if current_app else {}
+    max_age = int(config.get('RIDER_LOCATION_MAX_AGE', DEFAULT_MAX_AGE))
+    max_count = int(config.get('RIDER_LOCATION_MAX_COUNT', DEFAULT_MAX_COUNT))
+    buffer_max = int(config.get('RIDER_LOCATION_BUFFER_MAX', DEFAULT_BUFFER_MAX))
+    return max_age, max_count, buffer_max
+
+
+def _ingest_thresholds():
+    config = current_app.config if current_app else {}
+    min_distance = float(config.get('RIDER_LOCATION_MIN_DISTANCE', DEFAULT_MIN_DISTANCE))
+    min_interval = float(config.get('RIDER_LOCATION_MIN_INTERVAL', DEFAULT_MIN_INTERVAL))
+    max_interval = float(config.get('RIDER_LOCATION_MAX_INTERVAL', DEFAULT_MAX_INTERVAL))
+    return min_distance, min_interval, max_interval
+
+
+def should_accept_location(previous, latitude, longitude, order_id, now):
+    """
+    判断定位是否需要写入
+
+    间隔小于最小间隔的定位直接丢弃；移动距离不足阈值且未超过最大间隔的定位视为原地，
+    与上一个点合并；订单发生变化的定位总是写入。
+
+    Args:
+        previous: 上一个已写入定位 (latitude, longitude, score, order_id)，没有时为None
+    """
+    if previous is None or previous[0] is None or previous[2] is None:
+        return True
+
+    prev_lat, prev_lon, prev_score, prev_order_id = previous
+    if str(order_id or '') != (prev_order_id or ''):
+        return True
+
+    min_distance, min_interval, max_interval = _ingest_thresholds()
+    elapsed = now - float(prev_score)
+    if elapsed < min_interval:
+        return False
+    if elapsed >= max_interval:
+        return True
+
+    moved = haversine(float(prev_lat), float(prev_lon), float(latitude), float(longitude))
+    return moved >= min_distance
+
+
+def record_rider_location(rider_id, latitude, longitude, accuracy=None, speed=None, order_id=None):
+    """
+    写入一次骑手定位
+
+    先读取上一个已写入的定位做降采样判断（一次Redis往返，被过滤的定位到此为止），
+    再在同一个pipeline中写入轨迹、按时间和条数裁剪、刷新最新位置和派单GEO索引，
+    并放入落库缓冲（第二次往返），轨迹占用内存保持有界。
+
+    Returns:
+        dict: 写入的位置数据，被降采样过滤或Redis不可用时返回None
+    """
+    redis_client = get_redis_client()
+    if redis_client is None:
+        logger.error("Redis client not available, drop rider location")
+        return None
+
+    now = time.time()
+    previous = redis_client.hmget(latest_key(rider_id), 'latitude', 'longitude', 'score', 'order_id')
+    if not should_accept_location(previous, latitude, longitude, order_id, now):
+        return None
+
+    location_data = {
+        'rider_id': rider_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'accuracy': accuracy,
+        'speed': speed,
+        'order_id': order_id,
+        'timestamp': datetime.fromtimestamp(now).isoformat()
+    }
+    max_age, max_count, buffer_max = _location_limits()
+    payload = json.dumps(location_data)
+
+    key = history_key(rider_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zadd(key, {payload: now})
+    pipe.zremrangebyscore(key, '-inf', now - max_age)
+    pipe.zremrangebyrank(key, 0, -(max_count + 1))
+    pipe.expire(key, max_age)
+
+    latest = {k: v for k, v in location_data.items() if v is not None}
+    latest['score'] = now
+    pipe.hset(latest_key(rider_id), mapping=latest)
+    if order_id is None:
+        pipe.hdel(latest_key(rider_id), 'order_id')
+    pipe.expire(latest_key(rider_id), max_age)
+
+    update_rider_position(rider_id, latitude, longitude, pipe=pipe)
+
+    # 放入落库缓冲，由 tasks.db_tasks.flush_rider_locations 批量写入数据库
+    pipe.rpush(LOCATION_BUFFER_KEY, payload)
+    pipe.ltrim(LOCATION_BUFFER_KEY, -buffer_max, -1)
+    pipe.execute()
+    return location_data
+
+
+def get_latest_location(rider_id):
+    """获取骑手最新位置"""
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return None
+
+    latest = redis_client.hgetall(latest_key(rider_id))
+    if not latest:
+        return None
+
+    for field in ('latitude', 'longitude', 'accuracy', 'speed', 'score'):
+        if field in latest:
+            latest[field] = float(latest[field])
+    for field in ('rider_id', 'order_id'):
+        if field in latest:
+            latest[field] = int(latest[field])
+    return latest
+
+
+def read_location_history(rider_id, limit=50, since=None):
+    """按时间倒序获取骑手轨迹，since为起始时间戳（秒）"""
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return []
+
+    min_score = since if since is not None else '-inf'
+    history = redis_client.zrevrangebyscore(history_key(rider_id), '+inf', min_score, start=0, num=limit)
+    return [json.loads(h) for h in history]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/10/6 10:12
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : task_queue.py
+# @Software: PyCharm
+
+# ==============================
+# Web 进程投递 Celery 任务
+# ==============================
+# tasks.celery_app 导入时会创建独立的 Flask 应用并连接 Redis，不适合在 Web 进程中导入。
+# 这里只按 CELERY_BROKER_URL 建一个轻量的生产者客户端，按任务名投递，由 worker 执行。
+import logging
+import threading
+
+from celery import Celery
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+DB_TASKS_QUEUE = 'db_tasks'
+
+_celery_client = None
+_celery_lock = threading.Lock()
+
+
+def get_celery_client():
+    """获取只用于投递任务的Celery客户端（每进程一个）"""
+    global _celery_client
+    if _celery_client is None:
+        with _celery_lock:
+            if _celery_client is None:
+                _celery_client = Celery(
+                    'fango',
+                    broker=current_app.config.get('CELERY_BROKER_URL'),
+                    backend=current_app.config.get('CELERY_RESULT_BACKEND'),
+                )
+    return _celery_client
+
+
+def send_task(name, args=None, kwargs=None, queue=DB_TASKS_QUEUE, task_id=None):
+    """
+    按任务名投递Celery任务
+
+    Args:
+        name: 任务全名，如 tasks.db_tasks.distribute_coupon
+        queue: 目标队列，默认 db_tasks
+        task_id: 预先生成的任务ID，调用方需要在投递前记录ID时传入
+
+    Returns:
+        str: 任务ID
+    """
+    result = get_celery_client().send_task(name, args=args, kwargs=kwargs, queue=queue, task_id=task_id)
+    logger.info(f"已投递任务 {name}，task_id={result.id}")
+    return result.id
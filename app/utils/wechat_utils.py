@@ -7,60 +7,148 @@
 
 
 import hashlib
+import logging
+import os
+import threading
+import time
 import xml.etree.ElementTree as ET
 import requests
 import random
 import string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 3  # 连接超时（秒）
+DEFAULT_READ_TIMEOUT = 10  # 读取超时（秒）
+DEFAULT_RETRIES = 2  # 连接失败、5xx 时的重试次数
+DEFAULT_POOL_SIZE = 20  # 每个进程到微信支付的长连接数
+DEFAULT_SANDBOX_KEY_TTL = 3600  # 沙箱密钥缓存时间（秒）
+DEFAULT_SANDBOX_KEY_RETRY_INTERVAL = 60  # 获取沙箱密钥失败后，间隔多久再请求（秒）
+
+SANDBOX_SIGNKEY_URL = 'https://api.mch.weixin.qq.com/sandboxnew/pay/getsignkey'
+
+
+def build_session(retries=DEFAULT_RETRIES, pool_size=DEFAULT_POOL_SIZE, backoff_factor=0.3):
+    """
+    创建带连接池和重试的 requests.Session
+
+    统一下单以 out_trade_no 幂等，POST 也按退避重试。
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'POST']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Content-Type': 'application/xml'})
+    return session
+
 
 # 微信支付的工具类
 class WeChatPay:
-    def __init__(self, appid, mch_id, api_key, sandbox=False):
+    # 沙箱密钥进程内缓存：(mch_id, api_key) -> {signkey, expires_at, retry_at, fetching}
+    # 锁只保护缓存状态，不在持锁期间发请求
+    _sandbox_keys = {}
+    _sandbox_lock = threading.Lock()
+
+    def __init__(self, appid, mch_id, api_key, sandbox=False, session=None,
+                 timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT), sandbox_key_ttl=DEFAULT_SANDBOX_KEY_TTL,
+                 sandbox_key_retry_interval=DEFAULT_SANDBOX_KEY_RETRY_INTERVAL):
         self.appid = appid
         self.mch_id = mch_id
-        self.api_key = api_key
+        self._api_key = api_key
         self.sandbox = sandbox
+        self.session = session or build_session()
+        self.timeout = timeout
+        self.sandbox_key_ttl = sandbox_key_ttl
+        self.sandbox_key_retry_interval = sandbox_key_retry_interval
 
         if sandbox:
             self.unifiedorder_url = 'https://api.mch.weixin.qq.com/sandboxnew/pay/unifiedorder'
-            self._get_sandbox_key()
         else:
             self.unifiedorder_url = 'https://api.mch.weixin.qq.com/pay/unifiedorder'
 
+    @property
+    def api_key(self):
+        """签名使用的密钥，沙箱环境下首次使用时获取沙箱密钥并缓存"""
+        if self.sandbox:
+            return self._get_sandbox_key() or self._api_key
+        return self._api_key
+
+    def _post(self, url, xml_data):
+        response = self.session.post(url, data=xml_data.encode('utf-8'), timeout=self.timeout)
+        response.raise_for_status()
+        response.encoding = 'utf-8'
+        return self.xml_to_dict(response.text)
+
     def _get_sandbox_key(self):
-        """获取沙箱环境API密钥"""
+        """
+        获取沙箱环境API密钥，同一商户在缓存有效期内只请求一次
+
+        缓存过期后只由一个线程请求新密钥，其余线程直接使用上一次成功获取的密钥；
+        请求失败后在 sandbox_key_retry_interval 内不再请求，避免每次签名都阻塞在网络调用上。
+        """
+        cache_key = (self.mch_id, self._api_key)
+        now = time.time()
+        with self._sandbox_lock:
+            entry = self._sandbox_keys.setdefault(
+                cache_key, {'signkey': None, 'expires_at': 0, 'retry_at': 0, 'fetching': False}
+            )
+            if entry['signkey'] and entry['expires_at'] > now:
+                return entry['signkey']
+            if entry['fetching'] or entry['retry_at'] > now:
+                return entry['signkey']
+            entry['fetching'] = True
+            last_signkey = entry['signkey']
+
+        signkey = None
         try:
             params = {
                 'mch_id': self.mch_id,
                 'nonce_str': self.generate_nonce_str()
             }
-            params['sign'] = self.generate_sign(params)
+            # 获取沙箱密钥本身使用正式密钥签名
+            params['sign'] = self.generate_sign(params, api_key=self._api_key)
 
-            xml_data = self.dict_to_xml(params)
-            response = requests.post(
-                'https://api.mch.weixin.qq.com/sandboxnew/pay/getsignkey',
-                data=xml_data,
-                headers={'Content-Type': 'application/xml'}
-            )
-
-            result = self.xml_to_dict(response.text)
-            if result.get('return_code') == 'SUCCESS':
-                self.api_key = result.get('sandbox_signkey')
+            result = self._post(SANDBOX_SIGNKEY_URL, self.dict_to_xml(params))
+            if result.get('return_code') == 'SUCCESS' and result.get('sandbox_signkey'):
+                signkey = result['sandbox_signkey']
+            else:
+                logger.error(f"获取沙箱密钥失败: {result.get('return_msg')}")
         except Exception as e:
-            print(f"获取沙箱密钥失败: {e}")
+            logger.error(f"获取沙箱密钥失败: {e}")
+        finally:
+            with self._sandbox_lock:
+                entry['fetching'] = False
+                if signkey:
+                    entry.update(signkey=signkey, expires_at=time.time() + self.sandbox_key_ttl, retry_at=0)
+                else:
+                    entry['retry_at'] = time.time() + self.sandbox_key_retry_interval
+        return signkey or last_signkey
 
     def generate_nonce_str(self, length=32):
         """生成随机字符串"""
         chars = string.ascii_letters + string.digits
         return ''.join(random.choice(chars) for _ in range(length))
 
-    def generate_sign(self, params):
+    def generate_sign(self, params, api_key=None):
         """生成签名"""
         # 参数按ASCII码排序
         sorted_params = sorted(params.items())
         # 拼接成URL参数形式
         stringA = '&'.join([f"{k}={v}" for k, v in sorted_params if v and k != 'sign'])
         # 拼接API密钥
-        stringSignTemp = f"{stringA}&key={self.api_key}"
+        stringSignTemp = f"{stringA}&key={api_key or self.api_key}"
         # MD5加密并转为大写
         return hashlib.md5(stringSignTemp.encode('utf-8')).hexdigest().upper()
 
@@ -108,13 +196,8 @@ class WeChatPay:
         # 转换为XML
         xml_data = self.dict_to_xml(params)
 
-        # 发送请求
-        response = requests.post(self.unifiedorder_url, data=xml_data, headers={'Content-Type': 'application/xml'})
-
-        # 解析响应
-        result = self.xml_to_dict(response.text)
-
-        return result
+        # 发送请求并解析响应
+        return self._post(self.unifiedorder_url, xml_data)
 
     def verify_sign(self, params):
         """验证签名"""
@@ -125,3 +208,51 @@ class WeChatPay:
         calculated_sign = self.generate_sign(params)
         return sign == calculated_sign
 
+
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+
+def get_wechat_pay(config):
+    """
+    获取进程内共享的 WeChatPay 客户端
+
+    同一进程复用一个连接池；配置变化或 fork 出新进程时重新创建。
+    """
+    global _client, _client_key
+    key = (
+        os.getpid(),
+        config.get('WECHAT_APPID'),
+        config.get('WECHAT_MCH_ID'),
+        config.get('WECHAT_API_KEY'),
+        bool(config.get('WECHAT_SANDBOX', True)),
+    )
+    client = _client
+    if client is not None and _client_key == key:
+        return client
+
+    with _client_lock:
+        if _client is None or _client_key != key:
+            session = build_session(
+                retries=int(config.get('WECHAT_HTTP_RETRIES', DEFAULT_RETRIES)),
+                pool_size=int(config.get('WECHAT_HTTP_POOL_SIZE', DEFAULT_POOL_SIZE)),
+            )
+            _client = WeChatPay(
+                appid=key[1],
+                mch_id=key[2],
+                api_key=key[3],
+                sandbox=key[4],
+                session=session,
+                timeout=(
+                    float(config.get('WECHAT_HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+                    float(config.get('WECHAT_HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)),
+                ),
+                sandbox_key_ttl=int(config.get('WECHAT_SANDBOX_KEY_TTL', DEFAULT_SANDBOX_KEY_TTL)),
+                sandbox_key_retry_interval=int(
+                    config.get('WECHAT_SANDBOX_KEY_RETRY_INTERVAL', DEFAULT_SANDBOX_KEY_RETRY_INTERVAL)
+                ),
+            )
+            _client_key = key
+        return _client
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+# gunicorn 配置：worker 退出时清理 Prometheus 多进程指标文件
+import os
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -31,4 +31,7 @@ echo "消息队列已就绪!"
 # 启动 Celery Worker
 echo "启动 Celery Worker..."
 echo "当前环境: $FLASK_ENV"
+# Prometheus 多进程指标目录（prefork子进程写入，主进程在 9540 端口汇总输出）
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc_celery}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 exec celery -A tasks.celery_app:celery worker --loglevel=info --queues=db_tasks,email_tasks
\ No newline at end of file
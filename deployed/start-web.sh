@@ -74,5 +74,8 @@ else
     echo "启动生产服务器..."
     # 生产环境使用支持 WebSocket 的服务器
     # 使用 eventlet worker 同时处理 HTTP 和 WebSocket
-    exec gunicorn -w 4 -b 0.0.0.0:5000 -k eventlet --access-logfile - --error-logfile - run:app
+    # Prometheus 多进程指标目录，每次启动前清空
+    export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    exec gunicorn -c deployed/gunicorn.conf.py -w 4 -b 0.0.0.0:5000 -k eventlet --access-logfile - --error-logfile - run:app
 fi
\ No newline at end of file
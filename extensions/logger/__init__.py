@@ -6,22 +6,167 @@
 # @Software: PyCharm
 
 import logging
+import os
+import threading
+import time
+from collections import deque
 from datetime import datetime
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+DUPLICATE_KEY_ERROR = 11000
 
 
 class MongoDBHandler(logging.Handler):
-    def __init__(self, mongo_uri, db_name, collection_name):
+    """
+    MongoDB日志处理器
+
+    emit 只把日志放入有界缓冲区，由后台线程按批 insert_many 写入，请求线程不访问MongoDB。
+    缓冲区满时按 drop_policy 丢弃最旧（oldest）或最新（newest）的日志；
+    连接或写入失败时熔断 breaker_cooldown 秒（连续失败时翻倍，最长 breaker_max_cooldown 秒），
+    熔断期间日志继续缓冲。无法写入的单条日志（无法编码、超过大小限制等）丢弃并计数，不影响同批其他日志。
+    stats() 返回写入、丢弃等计数。
+    """
+
+    def __init__(self, mongo_uri, db_name, collection_name, buffer_size=10000, batch_size=500,
+                 flush_interval=1.0, drop_policy='oldest', breaker_cooldown=5, breaker_max_cooldown=300):
         super().__init__()
         self.mongo_uri = mongo_uri
         self.db_name = db_name
         self.collection_name = collection_name
         self.client = None
         self.collection = None
-        self.connect()
+
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.breaker_cooldown = breaker_cooldown
+        self.breaker_max_cooldown = breaker_max_cooldown
+
+        self._counters = {'emitted': 0, 'flushed': 0, 'dropped': 0, 'failed_batches': 0, 'breaker_trips': 0}
+        self._failures = 0
+        self._breaker_open_until = 0
+        self._start_worker()
+
+    # ---------- 后台线程 ----------
+
+    def _start_worker(self):
+        self._pid = os.getpid()
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='MongoDBLogFlusher', daemon=True)
+        self._worker.start()
+
+    def _ensure_worker(self):
+        # fork 出的子进程（如 gunicorn worker）不会继承后台线程和 MongoClient，需要重新创建
+        if self._pid != os.getpid():
+            self.client = None
+            self.collection = None
+            self._start_worker()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            with self._cond:
+                if len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+            try:
+                self._flush_pending()
+            except Exception as e:
+                # 兜底：任何异常都不能让后台线程退出，否则之后的日志只会堆积在缓冲区
+                print(f"日志写入线程异常: {e}")
+                self._counters['failed_batches'] += 1
+
+    def _flush_pending(self):
+        while self._buffer and not self._breaker_open():
+            with self._cond:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            unwritten = self._write(batch)
+            if unwritten:
+                self._requeue(unwritten)
+                return
+            if len(batch) < self.batch_size:
+                return
+
+    def _write(self, batch):
+        """
+        批量写入，返回需要放回缓冲区稍后重试的日志（连接类错误），全部处理完时返回空列表
+
+        insert_many 会给每条日志设置 _id，重试时保留 _id：之前已部分写入的日志再次写入时
+        报重复键，按已写入处理，不会重复写入也不会反复失败。
+        """
+        if self.collection is None and not self.connect():
+            return batch
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # 无序写入：writeErrors 之外的日志均已写入；重复键说明该日志之前已写入
+            errors = e.details.get('writeErrors', [])
+            rejected = sum(1 for error in errors if error.get('code') != DUPLICATE_KEY_ERROR)
+            if rejected:
+                print(f"日志批量写入部分失败，丢弃 {rejected} 条: {errors[0].get('errmsg')}")
+                self._counters['failed_batches'] += 1
+                self._counters['dropped'] += rejected
+            self._counters['flushed'] += len(batch) - rejected
+            self._failures = 0
+            return []
+        except PyMongoError as e:
+            print(f"日志批量写入失败: {e}")
+            self._counters['failed_batches'] += 1
+            self._trip_breaker()
+            return batch
+        except Exception as e:
+            # 无法编码的日志（InvalidDocument、DocumentTooLarge 等）不是连接问题，逐条写入隔离坏数据
+            print(f"日志批量写入失败，逐条写入: {e}")
+            self._counters['failed_batches'] += 1
+            return self._write_each(batch)
+
+        self._counters['flushed'] += len(batch)
+        self._failures = 0
+        return []
+
+    def _write_each(self, batch):
+        for i, entry in enumerate(batch):
+            try:
+                self.collection.insert_one(entry)
+            except DuplicateKeyError:
+                pass
+            except PyMongoError as e:
+                print(f"日志写入失败: {e}")
+                self._trip_breaker()
+                return batch[i:]
+            except Exception as e:
+                print(f"日志无法写入，丢弃: {e}")
+                self._counters['dropped'] += 1
+                continue
+            self._counters['flushed'] += 1
+        self._failures = 0
+        return []
+
+    def _requeue(self, batch):
+        """写入失败的日志放回缓冲区头部，放不下的丢弃"""
+        with self._cond:
+            room = self.buffer_size - len(self._buffer)
+            if room < len(batch):
+                self._counters['dropped'] += len(batch) - max(room, 0)
+                batch = batch[len(batch) - max(room, 0):]
+            self._buffer.extendleft(reversed(batch))
+
+    # ---------- 熔断 ----------
+
+    def _breaker_open(self):
+        return time.time() < self._breaker_open_until
+
+    def _trip_breaker(self):
+        self._failures += 1
+        self._counters['breaker_trips'] += 1
+        cooldown = min(self.breaker_cooldown * 2 ** (self._failures - 1), self.breaker_max_cooldown)
+        self._breaker_open_until = time.time() + cooldown
+        self.collection = None
 
     def connect(self):
+        """连接MongoDB（仅在后台线程中调用），失败时打开熔断"""
         try:
             self.client = MongoClient(self.mongo_uri, serverSelectionTimeoutMS=5000)
             # 测试连接
@@ -32,65 +177,98 @@ class MongoDBHandler(logging.Handler):
             self.collection.create_index([("timestamp", 1)])
             self.collection.create_index([("level", 1)])
             self.collection.create_index([("module", 1)])
-        except ConnectionFailure as e:
+            return True
+        except PyMongoError as e:
             print(f"MongoDB连接失败: {e}")
             self.collection = None
+            self._trip_breaker()
+            return False
 
-    def emit(self, record):
-        # 修复：使用 is None 而不是真值测试
-        if self.collection is None:
-            self.connect()
-            # 如果连接仍然失败，直接返回
-            if self.collection is None:
-                return
+    # ---------- logging.Handler ----------
 
+    def emit(self, record):
         try:
-            # 在调用 format 之前设置 exc_info，这样 format 方法会自动处理异常
-            if record.exc_info:
-                # 确保异常信息被格式化到消息中
-                record.exc_text = self.format(record)
-
-            log_entry = {
-                'timestamp': datetime.now(),
-                'level': record.levelname,
-                'message': self.format(record),
-                'module': record.module,
-                'funcName': record.funcName,
-                'lineno': record.lineno,
-                'pathname': record.pathname,
-                'logger': record.name,
-                'thread': record.thread,
-                'threadName': record.threadName,
-                'created': datetime.fromtimestamp(record.created)
-            }
-
-            # 添加额外字段
-            if hasattr(record, 'user_id'):
-                log_entry['user_id'] = record.user_id
-            if hasattr(record, 'request_id'):
-                log_entry['request_id'] = record.request_id
-
-            # 如果存在异常信息，单独存储
-            if record.exc_info:
-                # 使用简单的方法获取异常信息
-                try:
-                    # 获取异常类型和值
-                    exc_type, exc_value, exc_traceback = record.exc_info
-                    log_entry['exception'] = {
-                        'type': str(exc_type.__name__),
-                        'message': str(exc_value),
-                        'traceback': self.formatException(record.exc_info) if hasattr(self, 'formatException') else str(
-                            exc_value)
-                    }
-                except:
-                    log_entry['exception'] = "无法解析异常信息"
-
-            self.collection.insert_one(log_entry)
+            self._ensure_worker()
+            log_entry = self._build_entry(record)
+        except Exception:
+            self.handleError(record)
+            return
 
-        except Exception as e:
-            print(f"日志写入失败: {e}")
+        with self._cond:
+            self._counters['emitted'] += 1
+            if len(self._buffer) >= self.buffer_size:
+                self._counters['dropped'] += 1
+                if self.drop_policy == 'newest':
+                    return
+                self._buffer.popleft()
+            self._buffer.append(log_entry)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def _build_entry(self, record):
+        # 在调用 format 之前设置 exc_info，这样 format 方法会自动处理异常
+        if record.exc_info:
+            # 确保异常信息被格式化到消息中
+            record.exc_text = self.format(record)
+
+        log_entry = {
+            'timestamp': datetime.now(),
+            'level': record.levelname,
+            'message': self.format(record),
+            'module': record.module,
+            'funcName': record.funcName,
+            'lineno': record.lineno,
+            'pathname': record.pathname,
+            'logger': record.name,
+            'thread': record.thread,
+            'threadName': record.threadName,
+            'created': datetime.fromtimestamp(record.created)
+        }
+
+        # 添加额外字段
+        if hasattr(record, 'user_id'):
+            log_entry['user_id'] = record.user_id
+        if hasattr(record, 'request_id'):
+            log_entry['request_id'] = record.request_id
+        if hasattr(record, 'access'):
+            log_entry['access'] = record.access
+
+        # 如果存在异常信息，单独存储
+        if record.exc_info:
+            # 使用简单的方法获取异常信息
+            try:
+                # 获取异常类型和值
+                exc_type, exc_value, exc_traceback = record.exc_info
+                log_entry['exception'] = {
+                    'type': str(exc_type.__name__),
+                    'message': str(exc_value),
+                    'traceback': self.formatException(record.exc_info) if hasattr(self, 'formatException') else str(
+                        exc_value)
+                }
+            except:
+                log_entry['exception'] = "无法解析异常信息"
+        return log_entry
+
+    def stats(self):
+        """写入统计：emitted / flushed / dropped / failed_batches / breaker_trips / buffered / breaker_open"""
+        stats = dict(self._counters)
+        stats['buffered'] = len(self._buffer)
+        stats['breaker_open'] = self._breaker_open()
+        return stats
+
+    def flush(self, timeout=5):
+        """尽量写出缓冲区中的日志（熔断期间直接返回）"""
+        deadline = time.time() + timeout
+        while self._buffer and not self._breaker_open() and time.time() < deadline:
+            self._flush_pending()
 
     def close(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify()
+        if self._pid == os.getpid() and self._worker.is_alive():
+            self._worker.join(timeout=self.flush_interval + 1)
+        self.flush()
         if self.client:
             self.client.close()
         super().close()
@@ -1,3 +1,3 @@
 # -*- coding:utf-8 -*-
 from .sqlalchemy import SQLAlchemyPlus, CustomizedQuery, IdModel
-from .schema import Paginator, PageSchema
+from .schema import Paginator, PageSchema, CursorPaginator, CursorPageSchema
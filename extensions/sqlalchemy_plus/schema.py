@@ -1,5 +1,10 @@
 # -*- coding:utf-8 -*-
+import base64
+import binascii
+from datetime import datetime
+
 from marshmallow import Schema, fields
+from sqlalchemy import and_, or_
 
 
 class _PageContent:
@@ -34,6 +39,86 @@ class Paginator:
         return _PageContent(mobile_page, self.page_query.all())
 
 
+class CursorPaginator:
+    """
+    游标（keyset）分页
+
+    按 (created_at, id) 倒序翻页，下一页条件为 (created_at, id) < 上一页最后一条，
+    配合 (..., created_at, id) 联合索引，任意深度翻页都只扫描 per_page + 1 行。
+    total 为可选的近似总数：最多统计 total_cap 行，超出时 total_is_estimate 为 True。
+    """
+    max_per_page = 100
+    total_cap = 10000
+
+    def __init__(self, query, model, cursor=None, per_page=20, with_total=False):
+        per_page = int(per_page or 20)
+        per_page = 20 if per_page < 1 else per_page
+        self.per_page = self.max_per_page if per_page > self.max_per_page else per_page
+        self.model = model
+        self.query = query
+        self.cursor = self.decode_cursor(cursor)
+        self.with_total = with_total
+
+    @staticmethod
+    def encode_cursor(created_at, id):
+        raw = f"{created_at.isoformat()}|{id}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """解析游标，格式错误时抛出 ValueError"""
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            created_at, id = raw.rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(id)
+        except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+
+    def _approximate_total(self):
+        capped = self.query.order_by(None).with_entities(self.model.id).limit(self.total_cap + 1).subquery()
+        total = self.query.session.query(capped).count()
+        if total > self.total_cap:
+            return self.total_cap, True
+        return total, False
+
+    def render_page(self):
+        created_at, id = self.model.created_at, self.model.id
+        page_query = self.query.order_by(None).order_by(created_at.desc(), id.desc())
+        if self.cursor is not None:
+            last_created_at, last_id = self.cursor
+            page_query = page_query.filter(or_(
+                created_at < last_created_at,
+                and_(created_at == last_created_at, id < last_id)
+            ))
+
+        # 多取一条判断是否还有下一页
+        items = page_query.limit(self.per_page + 1).all()
+        has_next = len(items) > self.per_page
+        items = items[:self.per_page]
+
+        cursor_page = CursorPage()
+        cursor_page.per_page = self.per_page
+        cursor_page.has_next = has_next
+        if has_next:
+            last = items[-1]
+            cursor_page.next_cursor = self.encode_cursor(last.created_at, last.id)
+        if self.with_total:
+            cursor_page.total, cursor_page.total_is_estimate = self._approximate_total()
+
+        return _PageContent(cursor_page, items)
+
+
+class CursorPage:
+    def __init__(self):
+        self.per_page = 0
+        self.has_next = False
+        self.next_cursor = None
+        self.total = None
+        self.total_is_estimate = False
+
+
 class Page:
     def __init__(self):
         self.page = 0
@@ -47,3 +132,11 @@ class PageSchema(Schema):
     page = fields.Integer()
     perPage = fields.Integer(attribute='per_page')
     hasNext = fields.Boolean(attribute='has_next')
+
+
+class CursorPageSchema(Schema):
+    perPage = fields.Integer(attribute='per_page')
+    hasNext = fields.Boolean(attribute='has_next')
+    nextCursor = fields.String(attribute='next_cursor', allow_none=True)
+    total = fields.Int(attribute='total', allow_none=True)
+    totalIsEstimate = fields.Boolean(attribute='total_is_estimate')
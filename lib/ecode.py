@@ -15,6 +15,7 @@ class ECode(Enum):
     错误码-中文
     """
     SUCC = EnumMem(200, ("成功", "SUCC"))
+    ACCEPTED = EnumMem(202, ("已受理", "Accepted"))
     ERROR = EnumMem(400, ("页面去火星了", "NOT FOUND"))
     AUTH = EnumMem(401, ("鉴权失败", "Authentication Failed"))
     FORBID = EnumMem(403, ("访问禁止", "Access Forbidden"))
@@ -8,6 +8,7 @@
 from celery import Celery
 from flask import Flask
 from .task_config import set_config
+from app.utils.metrics import instrument_celery, instrument_redis, instrument_sqlalchemy
 import redis
 import logging
 import os
@@ -16,6 +17,8 @@ logger = logging.getLogger(__name__)
 
 # 全局Redis客户端
 redis_client = None
+# 业务Redis客户端（与Flask应用共用的数据库）
+app_redis_client = None
 
 
 def init_redis():
@@ -71,6 +74,25 @@ def get_redis_client():
     return redis_client
 
 
+def get_app_redis_client():
+    """获取业务Redis客户端实例（与Flask应用 REDIS_HOST/REDIS_DB 一致）"""
+    global app_redis_client
+    if app_redis_client is None:
+        app_redis = getattr(set_config, 'app_redis', None) or {}
+        redis_url = os.environ.get('APP_REDIS_URL', app_redis.get('url'))
+        if not redis_url:
+            # 未配置时退回到结果后端所在的Redis
+            return get_redis_client()
+        try:
+            app_redis_client = instrument_redis(redis.Redis.from_url(redis_url, decode_responses=True))
+            app_redis_client.ping()
+            logger.info(f"App Redis initialized with url: {redis_url}")
+        except Exception as e:
+            logger.error(f"Failed to initialize app Redis: {str(e)}")
+            app_redis_client = None
+    return app_redis_client
+
+
 def create_celery_app(flask_app: Flask = None):
     """创建并配置 Celery 应用"""
     if flask_app is None:
@@ -125,6 +147,11 @@ def create_celery_app(flask_app: Flask = None):
                 return self.run(*args, **kwargs)
 
     celery.Task = ContextTask
+
+    # Prometheus 指标：任务耗时、SQL耗时，worker主进程在 metrics.port 暴露 /metrics
+    metrics = getattr(set_config, 'metrics', None) or {}
+    instrument_sqlalchemy()
+    instrument_celery(os.environ.get('CELERY_METRICS_PORT', metrics.get('port')))
     return celery
 
 
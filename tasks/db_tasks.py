@@ -6,50 +6,107 @@
 # @Software: PyCharm
 
 # tasks/db_tasks.py
-from tasks.celery_app import celery, get_redis_client
-from datetime import datetime
+from tasks.celery_app import celery, get_app_redis_client
+from tasks.task_config import set_config
+from datetime import date, datetime, timedelta
 from celery.utils.log import get_task_logger
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError
+import json
+import time
 
 logger = get_task_logger(__name__)
 
+COUPON_EXPIRY_STATS_KEY = 'coupon_expiry:stats'
+DEAD_LETTER_MAX = 10000  # 死信列表最多保留条数
+
+# 数据库连接类错误：整批稍后重试，不拆分、不进死信
+TRANSIENT_DB_ERRORS = (OperationalError, InterfaceError, DisconnectionError)
+
+
 @celery.task
 def update_coupon_status():
-    """每小时更新UserCoupon状态，将不符合条件的优惠券标记为失效"""
+    """
+    每天将不符合条件的未使用UserCoupon标记为失效
+
+    分批：先用 (status, coupon_id) 索引取出一批待失效记录的ID，再按主键 UPDATE，
+    每批单独提交，行锁持有时间短、内存占用与表大小无关。
+    已更新的记录不再是 unused，会自然离开下一批的查询范围，因此不需要 ORDER BY 或主键游标，
+    每批都只在索引中剩余的待失效记录上取前 batch_size 条，避免每批排序。
+    """
+    # 延迟导入模型以避免循环依赖
+    from app.models import UserCoupon, Coupon
+    from app import db
+
+    expiry_config = getattr(set_config, 'coupon_expiry', None) or {}
+    batch_size = int(expiry_config.get('batch_size', 1000))
+    batch_pause = float(expiry_config.get('batch_pause', 0))
+
+    started = time.time()
+    updated = 0
+    batches = 0
     try:
         logger.info("开始更新优惠券状态...")
 
-        # 延迟导入模型以避免循环依赖
-        from app.models import UserCoupon, Coupon
-        from app import db
-
         # 获取当前时间
         now = datetime.now()
 
-        # 查找所有未使用但需要失效的优惠券
-        # 条件包括：已过期、使用次数已达上限、或优惠券已被删除
-        expired_coupons = db.session.query(UserCoupon).join(Coupon).filter(
-            UserCoupon.status == UserCoupon.STATUS_UNUSED,
+        # 需要失效的优惠券：已过期、使用次数已达上限、或优惠券已被删除
+        invalid_coupons = db.select(Coupon.id).where(
             db.or_(
                 Coupon.valid_to < now,  # 已过期
                 db.and_(Coupon.usage_limit.isnot(None), Coupon.usage_count >= Coupon.usage_limit),  # 使用次数已达上限
                 Coupon.deleted == True  # 优惠券已被删除
             )
-        ).all()
+        )
+
+        while True:
+            ids = db.session.execute(
+                db.select(UserCoupon.id).where(
+                    UserCoupon.status == UserCoupon.STATUS_UNUSED,
+                    UserCoupon.coupon_id.in_(invalid_coupons)
+                ).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+
+            # 再次校验状态，避免覆盖期间被下单使用的优惠券
+            result = db.session.execute(
+                db.update(UserCoupon).where(
+                    UserCoupon.id.in_(ids),
+                    UserCoupon.status == UserCoupon.STATUS_UNUSED
+                ).values(status=UserCoupon.STATUS_EXPIRED, updated_at=now).execution_options(synchronize_session=False)
+            )
+            db.session.commit()
 
-        # 更新状态为过期
-        for user_coupon in expired_coupons:
-            user_coupon.status = UserCoupon.STATUS_EXPIRED
-            user_coupon.updated_at = now
+            updated += max(result.rowcount, 0)
+            batches += 1
+            if result.rowcount == 0:
+                # 本批记录均已被并发修改；防止查询结果不前进时空转，剩余的留给下次执行
+                break
+            if batch_pause > 0:
+                time.sleep(batch_pause)
 
-        db.session.commit()
+        stats = {
+            "updated": updated,
+            "batches": batches,
+            "batch_size": batch_size,
+            "duration_ms": int((time.time() - started) * 1000),
+            "last_run": now.isoformat(),
+        }
+        redis_client = get_app_redis_client()
+        if redis_client is not None:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hset(COUPON_EXPIRY_STATS_KEY, mapping=stats)
+            pipe.hincrby(COUPON_EXPIRY_STATS_KEY, "total_updated", updated)
+            pipe.execute()
 
-        logger.info(f"已更新 {len(expired_coupons)} 张失效优惠券的状态")
-        return {"status": "success", "updated_count": len(expired_coupons)}
+        logger.info(f"已更新 {updated} 张失效优惠券的状态，共 {batches} 批，耗时 {stats['duration_ms']}ms")
+        return {"status": "success", "updated_count": updated, **stats}
 
     except Exception as e:
         logger.error(f"更新优惠券状态失败: {str(e)}")
         db.session.rollback()
-        return {"status": "error", "message": str(e)}
+        return {"status": "error", "message": str(e), "updated_count": updated, "batches": batches}
 
 @celery.task
 def user_daily_coupon():
@@ -58,8 +115,9 @@ def user_daily_coupon():
         logger.info("开始为用户发放每日优惠券...")
 
         # 延迟导入模型以避免循环依赖
-        from app.models import UserCoupon, User, Coupon
+        from app.models import Coupon
         from app import db
+        from app.utils.coupon_distribution import distribute_coupon_to_users
         from datetime import datetime, date
 
         # 获取当前日期
@@ -95,83 +153,396 @@ def user_daily_coupon():
             db.session.commit()
             logger.info(f"已创建每日优惠券: {daily_coupon.code}")
 
-        # 获取所有未删除的用户
-        all_users = User.query.filter_by(deleted=False).all()
-        logger.info(f"找到 {len(all_users)} 个用户需要发放优惠券")
-
-        # 为每个用户发放优惠券
-        created_count = 0
-        for user in all_users:
-            # 检查用户是否已经拥有今日的优惠券
-            existing_coupon = UserCoupon.query.filter_by(
-                user_id=user.id,
-                coupon_id=daily_coupon.id,
-                status=UserCoupon.STATUS_UNUSED
-            ).first()
-
-            if not existing_coupon:
-                user_coupon = UserCoupon(
-                    status=UserCoupon.STATUS_UNUSED,
-                    used_at=None,
-                    user_id=user.id,
-                    coupon_id=daily_coupon.id
-                )
-                db.session.add(user_coupon)
-                created_count += 1
-
-        db.session.commit()
-        logger.info(f"已为 {created_count} 个用户发放每日优惠券")
-        return {"status": "success", "users_count": len(all_users), "coupons_created": created_count}
+        # 分块 INSERT ... SELECT 发放，进度记录在Redis中，中断后重新执行会从上次完成的块继续
+        coupon_config = getattr(set_config, 'coupon_distribution', None) or {}
+        result = distribute_coupon_to_users(
+            daily_coupon.id,
+            redis_client=get_app_redis_client(),
+            chunk_size=int(coupon_config.get('chunk_size', 5000))
+        )
+        logger.info(f"已为 {result['inserted']} 个用户发放每日优惠券")
+        return {"status": "success", "users_count": result['processed'], "coupons_created": result['inserted'],
+                "chunks": result['chunks']}
 
     except Exception as e:
         logger.error(f"发放每日优惠券失败: {str(e)}")
         db.session.rollback()
         return {"status": "error", "message": str(e)}
 
+@celery.task
+def distribute_coupon(coupon_id, restart=False):
+    """管理员触发的优惠券自动发放（由 Web 接口投递，进度写入 coupon_distribution:{coupon_id}）"""
+    from app import db
+    from app.utils.coupon_distribution import distribute_coupon_to_users
+
+    coupon_config = getattr(set_config, 'coupon_distribution', None) or {}
+    try:
+        result = distribute_coupon_to_users(
+            coupon_id,
+            redis_client=get_app_redis_client(),
+            chunk_size=int(coupon_config.get('chunk_size', 5000)),
+            restart=restart
+        )
+        logger.info(f"优惠券 {coupon_id} 自动发放完成，新发放 {result['inserted']} 张，跳过 {result['skipped']} 个")
+        return {"status": "success", **result}
+    except Exception as e:
+        logger.error(f"优惠券 {coupon_id} 自动发放失败: {str(e)}")
+        db.session.rollback()
+        return {"status": "error", "message": str(e)}
+
 @celery.task
 def update_restaurant_sales():
-    """每小时更新店铺总销售额并存储到Redis"""
+    """
+    定时校准餐馆销售额
+
+    订单完成时已增量累加（app.utils.restaurant_sales.record_completed_order），
+    这里用一次 GROUP BY 重新计算累计和当日销售额，通过pipeline写入Redis。
+    """
     try:
-        logger.info("开始更新店铺总销售额并存储到Redis...")
+        logger.info("开始校准店铺销售额...")
 
         # 延迟导入模型以避免循环依赖
-        from app.models import Restaurant, Order
         from app import db
+        from app.utils.restaurant_sales import rebuild_restaurant_sales
 
-        # 获取Redis客户端
-        redis_client = get_redis_client()
-
-        # 获取所有餐厅
-        restaurants = Restaurant.query.all()
-
-        updated_count = 0
-        for restaurant in restaurants:
-            # 计算该餐厅所有已完成订单的总金额
-            total_sales = db.session.query(
-                db.func.sum(Order.final_amount)
-            ).filter(
-                Order.restaurant_id == restaurant.id,
-                Order.status == Order.STATUS_COMPLETED
-            ).scalar() or 0.0
-
-            # 将销售额存储到Redis，使用餐厅ID作为键
-            if redis_client:
-                redis_key = f"restaurant_sales:{restaurant.id}"
-                redis_client.set(redis_key, str(total_sales))
-            else:
-                logger.warning("Redis客户端未初始化，跳过Redis存储")
-
-            # 同时更新数据库中的销售额（可选，根据需求决定是否保留）
-            # if restaurant.total_sales != total_sales:
-            #     restaurant.total_sales = total_sales
-                updated_count += 1
-
-        # db.session.commit()
-
-        logger.info(f"已更新 {updated_count} 家餐厅的销售额并存储到Redis")
+        # 与Flask应用共用的Redis
+        redis_client = get_app_redis_client()
+        if redis_client is None:
+            logger.warning("Redis客户端未初始化，跳过销售额校准")
+            return {"status": "error", "message": "Redis not available"}
+
+        updated_count = rebuild_restaurant_sales(redis_client)
+
+        logger.info(f"已校准 {updated_count} 家餐厅的销售额")
         return {"status": "success", "updated_count": updated_count}
 
     except Exception as e:
         logger.error(f"更新店铺销售额失败: {str(e)}")
         db.session.rollback()
         return {"status": "error", "message": str(e)}
+
+
+@celery.task
+def rollup_restaurant_statistics(start_date=None, end_date=None):
+    """
+    汇总餐馆每日统计到 restaurant_statistics
+
+    默认汇总昨天；传入 start_date/end_date（YYYY-MM-DD，含首尾）可回填历史数据，
+    同一天重复执行会覆盖旧结果。
+    """
+    # 延迟导入模型以避免循环依赖
+    from app import db
+    from app.utils.restaurant_statistics import rollup_date_range
+
+    try:
+        yesterday = datetime.now().date() - timedelta(days=1)
+        start = date.fromisoformat(start_date) if start_date else yesterday
+        end = date.fromisoformat(end_date) if end_date else start
+
+        logger.info(f"开始汇总餐馆统计 {start} ~ {end}...")
+        rows = rollup_date_range(start, end)
+
+        logger.info(f"餐馆统计汇总完成: {rows}")
+        return {"status": "success", "rows": rows}
+
+    except Exception as e:
+        logger.error(f"汇总餐馆统计失败: {str(e)}")
+        db.session.rollback()
+        return {"status": "error", "message": str(e)}
+
+
+class _BatchAborted(Exception):
+    """批处理遇到临时错误中止，pending 为尚未写入的条目（保持原顺序）"""
+
+    def __init__(self, cause, pending):
+        super().__init__(str(cause))
+        self.cause = cause
+        self.pending = pending
+
+
+def _apply_isolated(items, apply, on_poison, transient_errors=TRANSIENT_DB_ERRORS, on_committed=None):
+    """
+    整批写入并提交，失败时对半拆分重试，隔离出无法写入的单条交给 on_poison
+
+    正常情况一次提交；有 k 条坏数据时约 O(k·log n) 次提交。遇到 transient_errors 时
+    回滚并抛出 _BatchAborted，由调用方把未写入的条目放回队列。
+    on_committed(chunk, result) 在每块提交成功后调用，result 为 apply 的返回值。
+
+    Returns:
+        int: 成功写入的条数
+    """
+    from app import db
+
+    applied = 0
+    stack = [items]
+    while stack:
+        chunk = stack.pop()
+        try:
+            result = apply(chunk)
+            db.session.commit()
+        except transient_errors as e:
+            db.session.rollback()
+            pending = list(chunk)
+            for rest in reversed(stack):
+                pending.extend(rest)
+            raise _BatchAborted(e, pending)
+        except Exception as e:
+            db.session.rollback()
+            if len(chunk) == 1:
+                on_poison(chunk[0], e)
+                continue
+            mid = len(chunk) // 2
+            stack.append(chunk[mid:])
+            stack.append(chunk[:mid])
+            continue
+
+        applied += len(chunk)
+        # 已提交的块不再参与拆分重试，回调出错直接抛出
+        if on_committed is not None:
+            on_committed(chunk, result)
+    return applied
+
+
+def _dead_letter(redis_client, key, payload, error, max_len=DEAD_LETTER_MAX):
+    """写入死信列表，保留错误信息便于排查和人工重放"""
+    entry = json.dumps({
+        "payload": payload,
+        "error": str(error)[:500],
+        "failed_at": datetime.now().isoformat(),
+    }, default=str)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.rpush(key, entry)
+    if max_len:
+        pipe.ltrim(key, -max_len, -1)
+    pipe.execute()
+
+
+def _simplify_location_rows(rows, tolerance):
+    """按骑手和订单分段对轨迹做 Douglas-Peucker 抽稀"""
+    from app.utils.geo import simplify_track
+
+    tracks = {}
+    for row in rows:
+        tracks.setdefault((row['rider_id'], row['order_id']), []).append(row)
+
+    simplified = []
+    for track in tracks.values():
+        track.sort(key=lambda r: r['timestamp'])
+        keep = simplify_track([r['latitude'] for r in track], [r['longitude'] for r in track], tolerance)
+        simplified.extend(track[i] for i in keep)
+    return simplified
+
+
+@celery.task
+def flush_rider_locations():
+    """定时将Redis缓冲中的骑手定位批量写入RiderLocation表"""
+    # 延迟导入模型以避免循环依赖
+    from app.models import RiderLocation
+    from app import db
+    from app.utils.rider_location import LOCATION_BUFFER_KEY, LOCATION_DEAD_LETTER_KEY, LOCATION_FLUSH_STATS_KEY
+
+    flush_config = getattr(set_config, 'rider_location_flush', None) or {}
+    batch_size = int(flush_config.get('batch_size', 2000))
+    max_batches = int(flush_config.get('max_batches', 50))
+    simplify_tolerance = float(flush_config.get('simplify_tolerance', 0))
+
+    redis_client = get_app_redis_client()
+    if redis_client is None:
+        logger.warning("Redis客户端未初始化，跳过定位落库")
+        return {"status": "error", "message": "Redis not available"}
+
+    started = time.time()
+    backlog_before = redis_client.llen(LOCATION_BUFFER_KEY)
+    flushed = 0
+    skipped = 0
+    simplified = 0
+    batches = 0
+    dead_lettered = []
+
+    try:
+        while batches < max_batches:
+            # 原子地取出一批缓冲
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.lrange(LOCATION_BUFFER_KEY, 0, batch_size - 1)
+            pipe.ltrim(LOCATION_BUFFER_KEY, batch_size, -1)
+            raw_batch, _ = pipe.execute()
+            if not raw_batch:
+                break
+
+            rows = []
+            for raw in raw_batch:
+                try:
+                    item = json.loads(raw)
+                    rows.append({
+                        'rider_id': int(item['rider_id']),
+                        'order_id': int(item['order_id']) if item.get('order_id') else None,
+                        'latitude': float(item['latitude']),
+                        'longitude': float(item['longitude']),
+                        'accuracy': item.get('accuracy'),
+                        'speed': item.get('speed'),
+                        'timestamp': datetime.fromisoformat(item['timestamp']),
+                    })
+                except (KeyError, TypeError, ValueError):
+                    skipped += 1
+
+            if simplify_tolerance > 0:
+                before = len(rows)
+                rows = _simplify_location_rows(rows, simplify_tolerance)
+                simplified += before - len(rows)
+
+            def poison(row, error):
+                logger.warning(f"骑手定位写入失败，移入死信 (rider_id={row.get('rider_id')}): {error}")
+                _dead_letter(redis_client, LOCATION_DEAD_LETTER_KEY, row, error)
+                dead_lettered.append(row)
+
+            try:
+                # 整批写入；个别坏数据（如客户端上报的 order_id 不存在）被拆分隔离，不影响其余定位
+                flushed += _apply_isolated(
+                    rows, lambda chunk: db.session.bulk_insert_mappings(RiderLocation, chunk), poison
+                )
+            except _BatchAborted as e:
+                # 数据库暂不可用：未写入的定位放回缓冲头部，保持原有顺序，下次任务重试
+                requeue = [json.dumps(row, default=str) for row in e.pending]
+                if requeue:
+                    redis_client.lpush(LOCATION_BUFFER_KEY, *reversed(requeue))
+                raise e.cause
+
+            batches += 1
+
+        backlog_after = redis_client.llen(LOCATION_BUFFER_KEY)
+        stats = {
+            "flushed": flushed,
+            "skipped": skipped,
+            "simplified": simplified,
+            "dead_lettered": len(dead_lettered),
+            "batches": batches,
+            "backlog_before": backlog_before,
+            "backlog_after": backlog_after,
+            "duration_ms": int((time.time() - started) * 1000),
+            "last_run": datetime.now().isoformat(),
+        }
+
+        # 记录积压指标：backlog_after 持续增长说明落库速度跟不上定位上报
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(LOCATION_FLUSH_STATS_KEY, mapping=stats)
+        pipe.hincrby(LOCATION_FLUSH_STATS_KEY, "total_flushed", flushed)
+        pipe.hincrby(LOCATION_FLUSH_STATS_KEY, "total_dead_lettered", len(dead_lettered))
+        pipe.execute()
+
+        if dead_lettered:
+            logger.warning(f"{len(dead_lettered)} 条骑手定位无法写入，已移入 {LOCATION_DEAD_LETTER_KEY}")
+        if backlog_after >= batch_size:
+            logger.warning(f"骑手定位落库积压 {backlog_after} 条，请调大 batch_size/max_batches 或缩短执行间隔")
+        logger.info(f"已写入 {flushed} 条骑手定位，共 {batches} 批，剩余 {backlog_after} 条")
+        return {"status": "success", **stats}
+
+    except Exception as e:
+        logger.error(f"骑手定位落库失败: {str(e)}")
+        db.session.rollback()
+        return {"status": "error", "message": str(e), "flushed": flushed}
+
+
+@celery.task
+def process_payment_notifications():
+    """
+    定时从Redis队列批量取出支付回调，更新Payment和Order状态
+
+    每批一次提交；某批失败时对半拆分重试（_apply_isolated），无法处理的单条回调移入
+    payment_notify:dead_letter，不阻塞队列中的其他回调；订单不存在、金额不一致的回调同样移入死信。数据库连接类错误或订单并发冲突时，
+    未处理的回调放回队列头部。
+    """
+    # 延迟导入模型以避免循环依赖
+    from app import db
+    from app.utils.payment_notify import (
+        PAYMENT_NOTIFY_DEAD_LETTER_KEY, PAYMENT_NOTIFY_QUEUE_KEY, PAYMENT_NOTIFY_STATS_KEY,
+        apply_payment_notifications
+    )
+    from app.utils.order_state import OrderVersionConflict
+
+    notify_config = getattr(set_config, 'payment_notify', None) or {}
+    batch_size = int(notify_config.get('batch_size', 200))
+    max_batches = int(notify_config.get('max_batches', 20))
+
+    redis_client = get_app_redis_client()
+    if redis_client is None:
+        logger.warning("Redis客户端未初始化，跳过支付回调处理")
+        return {"status": "error", "message": "Redis not available"}
+
+    started = time.time()
+    totals = {"processed": 0, "applied": 0, "duplicates": 0, "missing": 0, "mismatched": 0, "dead_lettered": 0}
+    batches = 0
+
+    def poison(notification, error):
+        # 支付回调不截断死信列表，全部保留以便人工核对
+        logger.error(f"支付回调无法处理，已移入死信 ({notification.get('out_trade_no')}): {error}")
+        _dead_letter(redis_client, PAYMENT_NOTIFY_DEAD_LETTER_KEY, notification, error, max_len=None)
+        totals["dead_lettered"] += 1
+
+    def committed(chunk, result):
+        stats, rejected = result
+        totals["processed"] += len(chunk)
+        for key, value in stats.items():
+            totals[key] += value
+        # 订单不存在、金额不一致的回调已应答微信且不会再重试，移入死信待人工核对
+        for notification, reason in rejected:
+            _dead_letter(redis_client, PAYMENT_NOTIFY_DEAD_LETTER_KEY, notification, reason, max_len=None)
+            totals["dead_lettered"] += 1
+
+    try:
+        while batches < max_batches:
+            # 原子地取出一批回调
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.lrange(PAYMENT_NOTIFY_QUEUE_KEY, 0, batch_size - 1)
+            pipe.ltrim(PAYMENT_NOTIFY_QUEUE_KEY, batch_size, -1)
+            raw_batch, _ = pipe.execute()
+            if not raw_batch:
+                break
+
+            notifications = []
+            for raw in raw_batch:
+                try:
+                    notifications.append(json.loads(raw))
+                except ValueError as e:
+                    poison({"raw": raw}, e)
+
+            try:
+                # 订单并发修改与连接错误一样按临时错误处理：放回队列，下次重新读取订单状态
+                _apply_isolated(
+                    notifications, apply_payment_notifications, poison,
+                    transient_errors=TRANSIENT_DB_ERRORS + (OrderVersionConflict,), on_committed=committed
+                )
+            except _BatchAborted as e:
+                # 放回队列头部，保持原有顺序，下次任务重试
+                redis_client.lpush(
+                    PAYMENT_NOTIFY_QUEUE_KEY, *[json.dumps(n) for n in reversed(e.pending)]
+                )
+                raise e.cause
+            batches += 1
+
+        backlog = redis_client.llen(PAYMENT_NOTIFY_QUEUE_KEY)
+        stats = {
+            **totals,
+            "batches": batches,
+            "backlog": backlog,
+            "duration_ms": int((time.time() - started) * 1000),
+            "last_run": datetime.now().isoformat(),
+        }
+        if batches:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hset(PAYMENT_NOTIFY_STATS_KEY, mapping=stats)
+            pipe.hincrby(PAYMENT_NOTIFY_STATS_KEY, "total_processed", totals["processed"])
+            pipe.hincrby(PAYMENT_NOTIFY_STATS_KEY, "total_dead_lettered", totals["dead_lettered"])
+            pipe.execute()
+
+        if totals["dead_lettered"]:
+            logger.warning(f"{totals['dead_lettered']} 条支付回调无法处理，已移入 {PAYMENT_NOTIFY_DEAD_LETTER_KEY}")
+        if backlog >= batch_size:
+            logger.warning(f"支付回调积压 {backlog} 条，请调大 batch_size/max_batches 或缩短执行间隔")
+        if totals["processed"]:
+            logger.info(f"已处理 {totals['processed']} 条支付回调，共 {batches} 批，剩余 {backlog} 条")
+        return {"status": "success", **stats}
+
+    except Exception as e:
+        logger.error(f"处理支付回调失败: {str(e)}")
+        db.session.rollback()
+        return {"status": "error", "message": str(e), **totals}
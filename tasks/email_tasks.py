@@ -5,13 +5,20 @@
 # @File    : email_tasks.py.py
 # @Software: PyCharm
 
-from tasks.celery_app import celery
+from tasks.celery_app import celery, get_app_redis_client
+from tasks.task_config import set_config
+from datetime import datetime
 import time
 import random
+from celery import chord
 from celery.utils.log import get_task_logger
 
 logger = get_task_logger(__name__)
 
+REMINDER_QUEUE = 'email_tasks'
+REMINDER_PROGRESS_TTL = 3 * 24 * 3600
+REMINDER_RATE_SLICES = 10  # 每秒配额按 1/10 分片申请，减少窗口末尾配额浪费
+
 
 @celery.task(bind=True)
 def send_welcome_email(self, user_id):
@@ -39,26 +46,207 @@ def send_welcome_email(self, user_id):
         # 60秒后重试
         self.retry(exc=e, countdown=60, max_retries=3)
 
+def _reminder_config():
+    reminder_config = getattr(set_config, 'daily_reminder', None) or {}
+    return (
+        int(reminder_config.get('chunk_size', 5000)),
+        int(reminder_config.get('batch_size', 100)),
+        float(reminder_config.get('rate_per_second', 50)),
+    )
+
+
+def reminder_progress_key(run_id):
+    return f"daily_reminder:{run_id}"
+
+
+def get_reminder_progress(run_id):
+    """获取每日提醒进度：status / chunks / chunks_done / chunks_failed / sent / failed / started_at / finished_at"""
+    redis_client = get_app_redis_client()
+    if redis_client is None:
+        return None
+    return redis_client.hgetall(reminder_progress_key(run_id)) or None
+
+
+def _update_progress(run_id, mapping=None, incr=None):
+    redis_client = get_app_redis_client()
+    if redis_client is None:
+        return
+    try:
+        key = reminder_progress_key(run_id)
+        pipe = redis_client.pipeline(transaction=False)
+        if mapping:
+            pipe.hset(key, mapping=mapping)
+        for field, amount in (incr or {}).items():
+            pipe.hincrby(key, field, amount)
+        pipe.expire(key, REMINDER_PROGRESS_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"更新每日提醒进度失败 (run_id={run_id}): {e}")
+
+
+def _acquire_send_quota(redis_client, count, rate_per_second):
+    """
+    申请 count 条发送配额，所有 worker 上的子任务共用按秒计数的窗口，合计每秒不超过 rate_per_second
+
+    当前秒的配额不足时等待到下一秒再申请。count 不应超过 rate_per_second。
+    """
+    while True:
+        now = time.time()
+        key = f"daily_reminder:rate:{int(now)}"
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.incrby(key, count)
+        pipe.expire(key, 2)
+        used, _ = pipe.execute()
+        if used <= rate_per_second:
+            return
+        time.sleep(max(int(now) + 1 - time.time(), 0.01))
+
+
+def _iter_user_id_ranges(chunk_size):
+    """按主键顺序流式读取用户ID，每 chunk_size 个生成一个 (first_id, last_id) 区间"""
+    from app.models import User
+    from app import db
+
+    result = db.session.execute(
+        db.select(User.id).where(
+            User.deleted == False
+        ).order_by(User.id).execution_options(yield_per=chunk_size)
+    )
+    for partition in result.partitions():
+        yield partition[0][0], partition[-1][0]
+
+
+def _send_reminder(user):
+    """发送单条提醒（模拟，实际项目中替换为真实邮件发送逻辑）"""
+    logger.debug(f"发送每日提醒给 {user.email}")
+
+
 @celery.task
 def send_daily_reminder():
-    """发送每日提醒（定时任务）"""
+    """
+    发送每日提醒（定时任务）
+
+    协调任务只按主键顺序流式读取用户ID并切分为区间，每个区间派发一个
+    send_reminder_chunk 子任务并行发送，全部完成后由 finish_daily_reminder 汇总；
+    chord 意外失败时由 fail_daily_reminder 标记失败，避免进度一直停留在 running。
+    """
+    # 延迟导入模型以避免循环依赖
+    from app import db
+
+    run_id = datetime.now().strftime('%Y%m%d')
     try:
-        logger.info("开始发送每日提醒...")
+        logger.info(f"开始派发每日提醒 run_id={run_id}...")
+        chunk_size, _, _ = _reminder_config()
 
-        # 延迟导入模型以避免循环依赖
-        from app.models import User
-        from app import db
+        chunks = [
+            send_reminder_chunk.si(run_id, first_id, last_id).set(queue=REMINDER_QUEUE)
+            for first_id, last_id in _iter_user_id_ranges(chunk_size)
+        ]
+        db.session.remove()
 
-        # 获取所有用户
-        users = User.query.all()
+        _update_progress(run_id, mapping={
+            'status': 'running',
+            'chunks': len(chunks),
+            'chunks_done': 0,
+            'chunks_failed': 0,
+            'sent': 0,
+            'failed': 0,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': '',
+        })
+        if not chunks:
+            _update_progress(run_id, mapping={'status': 'done', 'finished_at': datetime.now().isoformat()})
+            return {"status": "success", "run_id": run_id, "chunks": 0}
 
-        for user in users:
-            # 模拟发送过程
-            time.sleep(0.5)
-            logger.info(f"发送每日提醒给 {user.email}")
+        callback = finish_daily_reminder.si(run_id).set(queue=REMINDER_QUEUE)
+        callback.link_error(fail_daily_reminder.si(run_id).set(queue=REMINDER_QUEUE))
+        chord(chunks)(callback)
 
-        logger.info(f"每日提醒发送完成! 共发送给 {len(users)} 位用户")
-        return {"status": "success", "users_count": len(users)}
+        logger.info(f"每日提醒已派发 {len(chunks)} 个子任务 run_id={run_id}")
+        return {"status": "success", "run_id": run_id, "chunks": len(chunks)}
     except Exception as e:
-        logger.error(f"发送每日提醒失败: {str(e)}")
+        logger.error(f"派发每日提醒失败: {str(e)}")
+        _update_progress(run_id, mapping={'status': 'failed'})
         return {"status": "error", "message": str(e)}
+
+
+@celery.task(bind=True, max_retries=3)
+def send_reminder_chunk(self, run_id, first_id, last_id):
+    """
+    向主键在 [first_id, last_id] 内的用户发送每日提醒
+
+    按 batch_size 分批读取，发送前向Redis申请全局配额（见 _acquire_send_quota），
+    所有子任务合计发送速率不超过 rate_per_second；Redis不可用时退化为单个子任务限速。
+    重试耗尽后记录失败并正常返回，保证 chord 回调仍会执行。
+    """
+    # 延迟导入模型以避免循环依赖
+    from app.models import User
+    from app import db
+
+    _, batch_size, rate_per_second = _reminder_config()
+    redis_client = get_app_redis_client() if rate_per_second > 0 else None
+    slice_size = max(1, int(rate_per_second // REMINDER_RATE_SLICES))
+    min_batch_seconds = batch_size / rate_per_second if rate_per_second > 0 and redis_client is None else 0
+
+    sent = failed = 0
+    cursor = first_id - 1
+    try:
+        while cursor < last_id:
+            started = time.monotonic()
+            users = db.session.query(User.id, User.email).filter(
+                User.id > cursor,
+                User.id <= last_id,
+                User.deleted == False
+            ).order_by(User.id).limit(batch_size).all()
+            if not users:
+                break
+
+            for i, user in enumerate(users):
+                if redis_client is not None and i % slice_size == 0:
+                    _acquire_send_quota(redis_client, min(slice_size, len(users) - i), rate_per_second)
+                try:
+                    _send_reminder(user)
+                    sent += 1
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"发送每日提醒失败 (user_id={user.id}): {e}")
+                cursor = user.id
+
+            elapsed = time.monotonic() - started
+            if elapsed < min_batch_seconds:
+                time.sleep(min_batch_seconds - elapsed)
+
+        _update_progress(run_id, incr={'chunks_done': 1, 'sent': sent, 'failed': failed})
+        return {"sent": sent, "failed": failed}
+    except Exception as e:
+        logger.error(f"每日提醒子任务失败 ({first_id}-{last_id}): {str(e)}")
+        db.session.rollback()
+        if self.request.retries >= self.max_retries:
+            # 重试耗尽：记为失败子任务并正常返回，不让整个 chord 失败
+            _update_progress(run_id, incr={'chunks_done': 1, 'chunks_failed': 1, 'sent': sent, 'failed': failed})
+            return {"sent": sent, "failed": failed, "error": str(e)}
+        # 已发送的部分先记入进度，重试时从未发送的用户继续
+        _update_progress(run_id, incr={'sent': sent, 'failed': failed})
+        raise self.retry(exc=e, countdown=60, args=(run_id, cursor + 1, last_id))
+    finally:
+        db.session.remove()
+
+
+@celery.task
+def finish_daily_reminder(run_id):
+    """所有子任务完成后标记进度，有子任务重试耗尽时标记为 partial"""
+    progress = get_reminder_progress(run_id) or {}
+    status = 'partial' if int(progress.get('chunks_failed') or 0) else 'done'
+    _update_progress(run_id, mapping={'status': status, 'finished_at': datetime.now().isoformat()})
+    progress = get_reminder_progress(run_id) or progress
+    logger.info(
+        f"每日提醒发送完成! run_id={run_id} 状态 {status} 已发送 {progress.get('sent')} 失败 {progress.get('failed')}"
+    )
+    return progress
+
+
+@celery.task
+def fail_daily_reminder(run_id):
+    """chord 失败（子任务异常退出、回调出错等）时标记进度为失败"""
+    _update_progress(run_id, mapping={'status': 'failed', 'finished_at': datetime.now().isoformat()})
+    logger.error(f"每日提醒执行失败 run_id={run_id}")
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/10/5 15:31
+# @Author  : JustKidding
+# @Email   : superjustkidding@gmail.com
+# @File    : order_create_benchmark.py
+# @Software: PyCharm
+
+# 下单基准：逐行ORM写入订单项/选项 vs 批量写入，按购物车大小统计耗时和SQL条数
+# 运行：PYTHONPATH=. python test/order_create_benchmark.py
+# 默认使用SQLite内存库，设置 BENCHMARK_DATABASE_URI 可指向MySQL测试库（会建表并写入测试数据）
+
+import os
+import time
+
+from flask import Flask
+from sqlalchemy import event
+
+from app import db
+from app.models import Order, OrderItem, OrderItemOption, OrderStatusHistory
+from app.routes.orders.entities import OrderEntity
+
+CART_SIZES = (1, 5, 20, 50, 100)
+OPTIONS_PER_ITEM = 2
+REPEAT = 20
+
+
+class BenchUser:
+    id = 1
+    is_admin = False
+
+
+def order_payload(cart_size):
+    return {
+        'restaurant_id': 1,
+        'total_amount': 10.0 * cart_size,
+        'final_amount': 10.0 * cart_size,
+        'delivery_address': 'benchmark',
+        'items': [{
+            'menu_item_id': i + 1,
+            'quantity': 1,
+            'price_at_order': 10.0,
+            'options': [{'option_id': j + 1} for j in range(OPTIONS_PER_ITEM)],
+        } for i in range(cart_size)],
+    }
+
+
+def create_order_per_row(data):
+    """改造前的写法：逐个添加订单项，选项依赖 flush 后的 item.id"""
+    order = Order(
+        user_id=BenchUser.id,
+        restaurant_id=data['restaurant_id'],
+        total_amount=data['total_amount'],
+        final_amount=data['final_amount'],
+        delivery_address=data['delivery_address'],
+        status=Order.STATUS_PENDING,
+    )
+    db.session.add(order)
+    db.session.flush()
+    for item_data in data['items']:
+        item = OrderItem(
+            order_id=order.id,
+            menu_item_id=item_data['menu_item_id'],
+            quantity=item_data['quantity'],
+            price_at_order=item_data['price_at_order'],
+        )
+        db.session.add(item)
+        db.session.flush()
+        for option_data in item_data['options']:
+            db.session.add(OrderItemOption(order_item_id=item.id, option_id=option_data['option_id']))
+    db.session.add(OrderStatusHistory(order_id=order.id, status=Order.STATUS_PENDING, actor_type='user'))
+    db.session.commit()
+
+
+def measure(func, data):
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        best = float('inf')
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            func(data)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    return best * 1000, statements[0] // REPEAT
+
+
+def main():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCHMARK_DATABASE_URI', 'sqlite://')
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        entity = OrderEntity(BenchUser())
+        print(f"dialect={db.engine.dialect.name}  options/item={OPTIONS_PER_ITEM}  best of {REPEAT}")
+        for size in CART_SIZES:
+            data = order_payload(size)
+            legacy_ms, legacy_sql = measure(create_order_per_row, data)
+            bulk_ms, bulk_sql = measure(entity.create_order, data)
+            print(f"items={size:>4}  per-row={legacy_ms:8.2f}ms ({legacy_sql:>4} SQL)  "
+                  f"bulk={bulk_ms:7.2f}ms ({bulk_sql:>2} SQL)  {legacy_ms / bulk_ms:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()